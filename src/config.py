@@ -17,6 +17,14 @@ class Jx3ApiConfig(BaseModel, extra=Extra.ignore):
     """主站的url"""
     api_token: str = Field("", alias="jx3api_token")
     """主站的token"""
+    cache_size: int = Field(1024, alias="jx3api_cache_size")
+    """接口缓存最大条数"""
+    ws_retry_max: int = Field(300, alias="jx3api_ws_retry_max")
+    """ws重连的最大等待时间，秒，等待时间从1秒开始翻倍增长"""
+    ws_alert_failures: int = Field(5, alias="jx3api_ws_alert_failures")
+    """ws连续连接失败多少次时通知超级用户，之后每翻倍一次再通知"""
+    ws_stall_minutes: int = Field(30, alias="jx3api_ws_stall_minutes")
+    """ws多少分钟没有收到消息时视为假死并重连，0为不检查"""
 
 
 class NlpConfig(BaseModel, extra=Extra.ignore):
@@ -90,6 +98,42 @@ class DefaultConfig(BaseModel, extra=Extra.ignore):
     """晚安通知内容"""
 
 
+class PushConfig(BaseModel, extra=Extra.ignore):
+    """
+    推送设置
+    """
+
+    rate: float = Field(3, alias="push_rate")
+    """每个机器人每秒最多发送的推送消息数"""
+    burst: int = Field(5, alias="push_burst")
+    """允许瞬间连续发送的消息数"""
+    concurrency: int = Field(5, alias="push_concurrency")
+    """每个机器人同时进行中的发送数"""
+    delivery_backlog: int = Field(10, alias="push_delivery_backlog")
+    """每个机器人后台进行中的推送分发数，达到上限时新消息在ws接收队列中等待"""
+    ingest_queue_size: int = Field(1000, alias="push_ingest_queue_size")
+    """ws消息排队上限，超出时先丢弃低优先级消息"""
+    ingest_workers: int = Field(4, alias="push_ingest_workers")
+    """ws消息分发worker数，同一类型的消息由同一个worker按顺序处理"""
+    dedup_window: int = Field(600, alias="push_dedup_window")
+    """重复ws消息的去重时间窗口，秒，0为不去重"""
+    dedup_size: int = Field(5000, alias="push_dedup_size")
+    """去重时最多记住的消息数"""
+    digest_window: int = Field(60, alias="push_digest_window")
+    """打开合并推送的群，多少秒内的推送合并为一条消息"""
+
+
+class DatabaseConfig(BaseModel, extra=Extra.ignore):
+    """
+    数据库设置
+    """
+
+    flush_interval: int = Field(1000, alias="database_flush_interval")
+    """统计数据延迟写入间隔，毫秒"""
+    flush_size: int = Field(200, alias="database_flush_size")
+    """待写入记录数达到多少时立即写入"""
+
+
 class PathConfig(BaseModel, extra=Extra.ignore):
     """
     路径设置
@@ -103,6 +147,41 @@ class PathConfig(BaseModel, extra=Extra.ignore):
     """html模板文件"""
 
 
+class BrowserConfig(BaseModel, extra=Extra.ignore):
+    """
+    浏览器设置
+    """
+
+    workers: int = Field(1, alias="browser_workers")
+    """渲染使用的chromium实例数"""
+    page_pool_size: int = Field(4, alias="browser_page_pool_size")
+    """每个chromium实例的预热页面池大小"""
+    page_max_renders: int = Field(200, alias="browser_page_max_renders")
+    """单个页面最多渲染次数，超过后关闭重建"""
+    render_concurrency: int = Field(0, alias="browser_render_concurrency")
+    """同时渲染的任务数，0为自动，等于chromium实例数乘以页面池大小"""
+    render_queue_size: int = Field(20, alias="browser_render_queue_size")
+    """排队渲染的任务上限，超出时直接拒绝"""
+    render_timeout: int = Field(30, alias="browser_render_timeout")
+    """单个渲染任务超时时间，秒"""
+    render_cache_ttl: int = Field(60, alias="browser_render_cache_ttl")
+    """模板图片默认缓存时间，秒，0为不缓存"""
+    render_cache_size: int = Field(64, alias="browser_render_cache_size")
+    """模板图片内存缓存上限，MB"""
+    render_cache_disk: bool = Field(False, alias="browser_render_cache_disk")
+    """是否同时把模板图片缓存到data目录"""
+    asset_cache_size: int = Field(32, alias="browser_asset_cache_size")
+    """远程图标和图片的内存缓存上限，MB"""
+    asset_cache_days: int = Field(7, alias="browser_asset_cache_days")
+    """远程图标和图片的磁盘缓存天数"""
+    image_format: str = Field("jpeg", alias="browser_image_format")
+    """图片格式，jpeg/png/webp，webp需要安装Pillow"""
+    image_quality: int = Field(85, alias="browser_image_quality")
+    """图片默认质量，1-100"""
+    image_max_width: int = Field(0, alias="browser_image_max_width")
+    """图片最大宽度，超过时等比缩小，0为不限制，需要安装Pillow"""
+
+
 class LogsConfig(BaseModel, extra=Extra.ignore):
     """
     日志设置
@@ -132,8 +211,14 @@ weather_config = WeatherConfig.parse_obj(config)
 """天气插件配置"""
 default_config = DefaultConfig.parse_obj(config)
 """默认设置"""
+push_config = PushConfig.parse_obj(config)
+"""推送设置"""
+database_config = DatabaseConfig.parse_obj(config)
+"""数据库设置"""
 path_config = PathConfig.parse_obj(config)
 """路径设置"""
+browser_config = BrowserConfig.parse_obj(config)
+"""浏览器设置"""
 logs_config = LogsConfig.parse_obj(config)
 """日志设置"""
 
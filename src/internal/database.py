@@ -2,8 +2,108 @@
 数据库初始化需要的模块
 """
 
+from typing import Any, Optional, Type
+
 from nonebot.log import logger
 from tortoise import Tortoise
+from tortoise.backends.base.client import BaseDBAsyncClient
+from tortoise.models import Model
+from tortoise.transactions import in_transaction
+
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "cache_size": -16000,
+    "mmap_size": 134217728,
+    "temp_store": "MEMORY",
+}
+"""
+sqlite连接参数：WAL日志模式，NORMAL同步级别（WAL下断电只可能丢失最后的事务），
+16MB页缓存，128MB内存映射，临时表放在内存
+"""
+
+INDEXES = [
+    ("uidx_user_info_user_group", "user_info", ("user_id", "group_id")),
+    ("uidx_plugin_info_group_module", "plugin_info", ("group_id", "module_name")),
+    ("uidx_search_record_group_app", "search_record", ("group_id", "app_name")),
+]
+"""需要建立的联合唯一索引：(索引名, 表名, 字段)"""
+
+COLUMNS = [
+    ("group_info", "ws_serendipity_digest", "INT NOT NULL DEFAULT 0"),
+]
+"""旧数据库中需要补上的字段：(表名, 字段名, 字段定义)"""
+
+
+async def _add_columns(connection: BaseDBAsyncClient):
+    """
+    说明:
+        给旧数据库的表补上后来新增的字段，generate_schemas不会修改已存在的表
+    """
+    for table, column, definition in COLUMNS:
+        columns = await connection.execute_query_dict(f"PRAGMA table_info({table})")
+        if any(one["name"] == column for one in columns):
+            continue
+        await connection.execute_query(
+            f"ALTER TABLE {table} ADD COLUMN {column} {definition}"
+        )
+        logger.info(f"数据库迁移 | 已添加字段 {table}.{column}")
+
+
+async def _create_indexes(connection: BaseDBAsyncClient):
+    """
+    说明:
+        建立热点查询使用的联合唯一索引，已存在的索引会跳过
+
+        旧数据库中可能有并发写入产生的重复记录，建索引前会先清理，保留最早的一条
+    """
+    for index_name, table, columns in INDEXES:
+        exist = await connection.execute_query_dict(
+            "SELECT name FROM sqlite_master WHERE type='index' AND name=?",
+            [index_name],
+        )
+        if exist:
+            continue
+        column_str = ", ".join(columns)
+        await connection.execute_query(
+            f"DELETE FROM {table} WHERE id NOT IN "
+            f"(SELECT MIN(id) FROM {table} GROUP BY {column_str})"
+        )
+        await connection.execute_query(
+            f"CREATE UNIQUE INDEX {index_name} ON {table} ({column_str})"
+        )
+        logger.info(f"数据库迁移 | 已建立索引 {index_name}")
+
+
+async def atomic_update(
+    model: Type[Model],
+    key: dict[str, Any],
+    updates: dict[str, Any],
+    returning: tuple[str, ...],
+    condition: Optional[dict[str, Any]] = None,
+) -> Optional[dict[str, Any]]:
+    """
+    说明:
+        原子更新一条记录并返回更新后的字段值，更新值可以使用F()表达式，
+        比如`{"gold": F("gold") - 10}`，不会出现读-改-写的并发覆盖
+
+    参数:
+        * `model`：模型类
+        * `key`：定位记录的条件，比如`{"user_id": 1, "group_id": 2}`
+        * `updates`：更新的字段
+        * `returning`：需要返回的字段
+        * `condition`：可选，附加的更新条件，比如`{"gold__gte": 10}`，不满足时不更新
+
+    返回:
+        * `Optional[dict[str, Any]]`：更新后的字段值，记录不存在或不满足条件时为None
+    """
+    # tortoise不支持UPDATE ... RETURNING，放在同一个事务内读回新值
+    async with in_transaction() as connection:
+        filters = {**key, **(condition or {})}
+        count = await model.filter(**filters).using_db(connection).update(**updates)
+        if not count:
+            return None
+        return await model.filter(**key).using_db(connection).first().values(*returning)
 
 
 async def database_init():
@@ -12,7 +112,6 @@ async def database_init():
     """
     logger.debug("正在注册数据库")
     database_path = "./data/data.db"
-    db_url = f"sqlite://{database_path}"
     # 这里填要加载的表
     models = [
         "src.modules.group_info",
@@ -21,7 +120,25 @@ async def database_init():
         "src.modules.ticket_info",
         "src.modules.search_record",
     ]
-    modules = {"models": models}
-    await Tortoise.init(db_url=db_url, modules=modules)
+    config = {
+        "connections": {
+            "default": {
+                "engine": "tortoise.backends.sqlite",
+                "credentials": {"file_path": database_path, **SQLITE_PRAGMAS},
+            }
+        },
+        "apps": {"models": {"models": models, "default_connection": "default"}},
+    }
+    await Tortoise.init(config=config)
     await Tortoise.generate_schemas()
+    await _add_columns(Tortoise.get_connection("default"))
+    await _create_indexes(Tortoise.get_connection("default"))
+    # 载入群设置和插件开关缓存，消息处理时不再读数据库
+    from src.modules.group_info import GroupInfo
+    from src.modules.plugin_info import PluginInfo
+    from src.modules.search_record import SearchRecord
+
+    await GroupInfo.load_cache()
+    await PluginInfo.load_cache()
+    await SearchRecord.load_cache()
     logger.opt(colors=True).info("<g>数据库初始化成功。</g>")
@@ -2,16 +2,75 @@
 jx3api接口的实现，用于连接api网站的数据处理
 """
 
+import asyncio
+import time
 from functools import partial
-from typing import Any
+from typing import Any, Hashable, Optional
 
 from httpx import AsyncClient
 from pydantic import BaseModel
 from typing_extensions import Protocol
 
 from src.config import Jx3ApiConfig, jx3api_config
+from src.utils.cache import TTLCache
 from src.utils.log import logger
 
+API_CACHE_TTL: dict[str, int] = {
+    "app_daily": 1800,
+    "app_check": 30,
+    "app_demon": 300,
+    "app_server": 86400,
+    "app_heighten": 86400,
+    "app_equip": 86400,
+    "app_macro": 3600,
+    "app_matrix": 86400,
+    "app_require": 86400,
+    "app_strategy": 86400,
+    "app_price": 600,
+    "next_price": 600,
+    "next_strategy": 86400,
+    "next_statistical": 300,
+    "next_collect": 300,
+    "next_recruit": 60,
+    "role_firework": 300,
+    "rank_role": 600,
+    "rank_faction": 600,
+    "rank_trials": 600,
+}
+"""接口缓存时间，秒，不在表内的接口不缓存"""
+
+API_CACHE_STALE: dict[str, int] = {
+    "app_daily": 600,
+    "app_demon": 60,
+    "app_server": 3600,
+    "app_heighten": 3600,
+    "app_equip": 3600,
+    "app_macro": 600,
+    "app_matrix": 3600,
+    "app_require": 3600,
+    "app_strategy": 3600,
+    "app_price": 300,
+    "next_price": 300,
+    "next_strategy": 3600,
+    "next_statistical": 60,
+    "next_collect": 60,
+    "role_firework": 60,
+    "rank_role": 300,
+    "rank_faction": 300,
+    "rank_trials": 300,
+}
+"""缓存过期后仍可先返回旧数据的时间，秒，同时在后台刷新；
+不在表内的接口（开服状态、招募等实时数据）过期后必须重新请求"""
+
+CACHE_BYPASS_PARAMS = {"ticket", "token"}
+"""带有这些参数的请求不走缓存，比如需要推栏ticket的接口"""
+
+COALESCE_PREFIXES = ("app_", "next_", "role_", "rank_")
+"""可以合并并发请求的数据查询接口，聊天、语音等transmit接口每个用户的请求都要单独发送"""
+
+NO_COALESCE = {"app_random"}
+"""数据查询接口中不合并并发请求的接口，每次返回结果都不同"""
+
 
 class _ApiCall(Protocol):
     async def __call__(self, **kwargs: Any) -> Any:
@@ -40,6 +99,16 @@ class JX3API:
     """浏览器客户端"""
     config: Jx3ApiConfig
     """api设置"""
+    _cache: TTLCache
+    """接口返回数据缓存"""
+    _refreshing: set[Hashable]
+    """正在后台刷新的缓存键"""
+    _inflight: dict[Hashable, asyncio.Task]
+    """正在进行中的请求，相同请求共用一个"""
+    _warmed: set[Hashable]
+    """预热后还没有被命中过的缓存键"""
+    _stats: dict[str, int]
+    """请求统计"""
 
     def __new__(cls, *args, **kwargs):
         """单例"""
@@ -55,6 +124,18 @@ class JX3API:
         token = self.config.api_token or ""
         headers = {"token": token, "User-Agent": "Nonebot2-jx3_bot"}
         self.client = AsyncClient(headers=headers)
+        self._cache = TTLCache(max_size=self.config.cache_size)
+        self._refreshing = set()
+        self._inflight = {}
+        self._warmed = set()
+        self._stats = {
+            "requests": 0,
+            "cache_hits": 0,
+            "coalesced": 0,
+            "upstream": 0,
+            "warmed": 0,
+            "warm_hits": 0,
+        }
 
     async def call_api(self, url: str, **data: Any) -> Response:
         """请求api网站数据"""
@@ -65,8 +146,136 @@ class JX3API:
             logger.error(f"<y>jx3api请求出错：</y> | {str(e)}")
             return Response(code=0, msg=f"{str(e)}", data={}, time=0)
 
+    @staticmethod
+    def _cache_key(name: str, data: dict[str, Any]) -> Hashable:
+        """缓存键：接口名加排序后的参数"""
+        return name, tuple(sorted((k, str(v)) for k, v in data.items()))
+
+    async def _request(self, key: Hashable, url: str, **data: Any) -> Response:
+        """
+        说明:
+            合并并发的相同请求，同一时间相同的接口和参数只会请求一次，结果共享
+        """
+        task = self._inflight.get(key)
+        if task is None:
+            self._stats["upstream"] += 1
+            task = asyncio.create_task(self.call_api(url, **data))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            self._stats["coalesced"] += 1
+        # shield防止某个调用者被取消时影响其他等待者
+        return await asyncio.shield(task)
+
+    async def _fetch(self, key: Hashable, url: str, ttl: int, **data: Any) -> Response:
+        """请求数据并写入缓存，只缓存成功的返回"""
+        response = await self._request(key, url, **data)
+        if response.code == 200:
+            self._cache.set(key, response, ttl)
+        return response
+
+    async def _revalidate(self, key: Hashable, url: str, ttl: int, **data: Any):
+        """后台刷新过期缓存"""
+        try:
+            await self._fetch(key, url, ttl, **data)
+        finally:
+            self._refreshing.discard(key)
+
+    async def call_cached(self, name: str, **data: Any) -> Response:
+        """
+        说明:
+            带缓存的请求，缓存过期后在一段时间内先返回旧数据，同时在后台刷新
+
+        参数:
+            * `name`：接口名，比如`app_daily`
+            * `**data`：请求参数
+
+        返回:
+            * `Response`：返回数据
+        """
+        self._stats["requests"] += 1
+        url = self.config.api_url + name.replace("_", "/", 1)
+        if name in NO_COALESCE or not name.startswith(COALESCE_PREFIXES):
+            self._stats["upstream"] += 1
+            return await self.call_api(url, **data)
+
+        key = self._cache_key(name, data)
+        ttl = API_CACHE_TTL.get(name, 0)
+        if ttl <= 0 or CACHE_BYPASS_PARAMS & data.keys():
+            return await self._request(key, url, **data)
+
+        entry = self._cache.get_entry(key)
+        if entry:
+            response, expire_at = entry
+            time_now = time.monotonic()
+            if time_now < expire_at:
+                logger.debug(f"<y>jx3api缓存命中:</y> | {name}")
+                self._hit(key)
+                return response
+            if time_now < expire_at + API_CACHE_STALE.get(name, 0):
+                self._hit(key)
+                if key not in self._refreshing:
+                    self._refreshing.add(key)
+                    asyncio.create_task(self._revalidate(key, url, ttl, **data))
+                return response
+        return await self._fetch(key, url, ttl, **data)
+
+    def _hit(self, key: Hashable):
+        """记录一次缓存命中，预热的缓存第一次命中时单独计数"""
+        self._stats["cache_hits"] += 1
+        if key in self._warmed:
+            self._warmed.discard(key)
+            self._stats["warm_hits"] += 1
+
+    async def prefetch(self, name: str, ttl: Optional[int] = None, **data: Any) -> bool:
+        """
+        说明:
+            预取数据，忽略未过期的缓存直接请求，成功后写入缓存，用于高峰前预热
+
+        参数:
+            * `name`：接口名，比如`app_daily`
+            * `ttl`：缓存时间，秒，默认使用接口的缓存时间，预热离高峰较远时可以调大
+            * `**data`：请求参数
+
+        返回:
+            * `bool`：是否成功写入缓存
+        """
+        ttl = ttl or API_CACHE_TTL.get(name, 0)
+        if ttl <= 0:
+            return False
+        url = self.config.api_url + name.replace("_", "/", 1)
+        key = self._cache_key(name, data)
+        response = await self._fetch(key, url, ttl, **data)
+        if response.code != 200:
+            return False
+        self._warmed.add(key)
+        self._stats["warmed"] += 1
+        return True
+
+    def get_stats(self) -> dict[str, float]:
+        """
+        说明:
+            获取请求统计
+
+        返回:
+            * `dict[str, float]`：统计数据
+                * `requests`：总调用次数
+                * `cache_hits`：缓存命中次数
+                * `coalesced`：被合并的并发请求次数
+                * `upstream`：实际发往api网站的请求次数
+                * `warmed`：预热成功的次数
+                * `warm_hits`：预热的缓存被用户请求命中的次数
+                * `coalesce_ratio`：合并率，被合并请求占需要请求的比例
+        """
+        stats: dict[str, float] = dict(self._stats)
+        need_request = stats["coalesced"] + stats["upstream"]
+        stats["coalesce_ratio"] = (
+            stats["coalesced"] / need_request if need_request else 0.0
+        )
+        return stats
+
     def __getattr__(self, name: str) -> _ApiCall:
-        # 拼接url
+        if name.startswith("_"):
+            raise AttributeError(name)
         logger.debug(f"<y>jx3api请求功能:</y> | {name}")
-        url = self.config.api_url + name.replace("_", "/", 1)
-        return partial(self.call_api, url)
+        return partial(self.call_cached, name)
@@ -1,3 +1,5 @@
+from typing import Any, Optional
+
 from httpx import AsyncClient
 from pydantic import BaseModel
 
@@ -745,3 +747,33 @@ class JX3API:
             * `token`：ws token，不是api token
         """
         ...
+    async def call_api(self, url: str, **data: Any) -> Response:
+        """请求api网站数据"""
+        ...
+    async def call_cached(self, name: str, **data: Any) -> Response:
+        """
+        说明:
+            带缓存的请求，缓存过期后在一段时间内先返回旧数据，同时在后台刷新
+
+        参数:
+            * `name`：接口名，比如`app_daily`
+            * `**data`：请求参数
+        """
+        ...
+    async def prefetch(self, name: str, ttl: Optional[int] = None, **data: Any) -> bool:
+        """
+        说明:
+            预取数据，忽略未过期的缓存直接请求，成功后写入缓存
+
+        参数:
+            * `name`：接口名，比如`app_daily`
+            * `ttl`：缓存时间，秒，默认使用接口的缓存时间
+            * `**data`：请求参数
+        """
+        ...
+    def get_stats(self) -> dict[str, float]:
+        """
+        说明:
+            获取请求统计
+        """
+        ...
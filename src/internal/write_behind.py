@@ -0,0 +1,202 @@
+import asyncio
+import time
+from typing import Any, Optional, Type
+
+from tortoise.expressions import F
+from tortoise.models import Model
+from tortoise.transactions import in_transaction
+
+from src.config import database_config
+from src.utils.log import logger
+
+
+class WriteBehind:
+    """
+    延迟写入队列，用于不需要每次都落盘的统计数据
+
+    调用方只把自增和更新操作放进队列，同一条记录的多次操作会合并，
+    后台任务每隔一段时间或积攒到一定数量后在一个事务内批量写入。
+    队列只更新已存在的记录，不会新建，记录需要调用方先建好。
+    """
+
+    _pending: dict[tuple[Type[Model], tuple], dict[str, dict[str, Any]]]
+    """待写入的操作，键为(模型, 记录键)，值包含`key`，`incr`，`set`"""
+    _task: Optional[asyncio.Task]
+    """后台写入任务"""
+    _wakeup: Optional[asyncio.Event]
+    """积攒数量达到上限时唤醒写入任务"""
+    _lock: asyncio.Lock
+    """写入锁，写入和丢弃操作互斥"""
+    _stats: dict[str, float]
+    """写入统计"""
+
+    def __new__(cls, *args, **kwargs):
+        """单例"""
+        if not hasattr(cls, "_instance"):
+            orig = super(WriteBehind, cls)
+            cls._instance = orig.__new__(cls, *args, **kwargs)
+        return cls._instance
+
+    def __init__(self):
+        self._pending = {}
+        self._task = None
+        self._wakeup = None
+        self._lock = asyncio.Lock()
+        self._stats = {"queued": 0, "flushes": 0, "rows": 0, "last_flush": 0.0}
+
+    def _get_entry(self, model: Type[Model], key: dict[str, Any]) -> dict[str, dict]:
+        """获取一条记录的待写入操作，没有则新建"""
+        pending_key = (model, tuple(sorted(key.items())))
+        entry = self._pending.get(pending_key)
+        if entry is None:
+            entry = {"key": key, "incr": {}, "set": {}}
+            self._pending[pending_key] = entry
+        self._stats["queued"] += 1
+        self._start()
+        if len(self._pending) >= database_config.flush_size:
+            self._wakeup.set()
+        return entry
+
+    def increment(
+        self, model: Type[Model], key: dict[str, Any], field: str, value: int = 1
+    ):
+        """
+        说明:
+            记录一次字段自增，记录不存在时不写入
+
+        参数:
+            * `model`：模型类
+            * `key`：定位记录的字段，比如`{"group_id": 1}`
+            * `field`：自增的字段
+            * `value`：自增的值
+        """
+        incr = self._get_entry(model, key)["incr"]
+        incr[field] = incr.get(field, 0) + value
+
+    def update(self, model: Type[Model], key: dict[str, Any], **fields: Any):
+        """
+        说明:
+            记录一次字段更新，同一字段以最后一次为准，记录不存在时不写入
+
+        参数:
+            * `model`：模型类
+            * `key`：定位记录的字段，比如`{"group_id": 1}`
+            * `fields`：更新的字段
+        """
+        self._get_entry(model, key)["set"].update(fields)
+
+    async def discard(self, model: Type[Model], **match: Any):
+        """
+        说明:
+            丢弃匹配的待写入操作，删除记录前使用，会等待正在进行的写入完成
+
+        参数:
+            * `model`：模型类
+            * `match`：匹配的字段，比如`group_id=1`
+        """
+        async with self._lock:
+            for pending_key, entry in list(self._pending.items()):
+                if pending_key[0] is not model:
+                    continue
+                if all(entry["key"].get(k) == v for k, v in match.items()):
+                    self._pending.pop(pending_key)
+
+    def _start(self):
+        """启动后台写入任务"""
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        """后台写入任务，定时或被唤醒时写入"""
+        interval = max(database_config.flush_interval, 10) / 1000
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            # 关闭时任务被取消，正在进行的写入不能中断
+            await asyncio.shield(self.flush())
+
+    async def flush(self):
+        """
+        说明:
+            立即把所有待写入操作在一个事务内写入数据库，失败时操作会放回队列，
+            有写入正在进行时等它完成后再写入
+        """
+        async with self._lock:
+            if not self._pending:
+                return
+            pending, self._pending = self._pending, {}
+            time_start = time.monotonic()
+            try:
+                async with in_transaction() as connection:
+                    for (model, _), entry in pending.items():
+                        await self._write(model, entry, connection)
+            except Exception as e:
+                logger.error(f"<r>延迟写入失败</r> | {str(e)}")
+                self._restore(pending)
+                return
+            self._stats["flushes"] += 1
+            self._stats["rows"] += len(pending)
+            self._stats["last_flush"] = time.monotonic() - time_start
+
+    @staticmethod
+    async def _write(model: Type[Model], entry: dict[str, dict], connection):
+        """写入一条记录的合并操作，只更新，记录已被删除时不会建回来"""
+        key, incr, values = entry["key"], entry["incr"], entry["set"]
+        updates = {field: F(field) + value for field, value in incr.items()}
+        updates.update(values)
+        if not updates:
+            return
+        await model.filter(**key).using_db(connection).update(**updates)
+
+    def _restore(self, pending: dict):
+        """把写入失败的操作合并回队列"""
+        for pending_key, entry in pending.items():
+            current = self._pending.get(pending_key)
+            if current is None:
+                self._pending[pending_key] = entry
+                continue
+            for field, value in entry["incr"].items():
+                current["incr"][field] = current["incr"].get(field, 0) + value
+            current["set"] = {**entry["set"], **current["set"]}
+
+    async def close(self):
+        """
+        说明:
+            停止后台任务并写入剩余数据，关闭数据库前使用，
+            后台任务中正在进行的写入不会被取消，会等它提交后再返回
+        """
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self.flush()
+
+    def get_stats(self) -> dict[str, float]:
+        """
+        说明:
+            获取写入统计
+
+        返回:
+            * `dict[str, float]`：统计数据
+                * `queued`：入队的操作数
+                * `pending`：当前待写入的记录数
+                * `flushes`：写入次数
+                * `rows`：写入的记录数
+                * `last_flush`：上一次写入耗时，秒
+        """
+        return {**self._stats, "pending": len(self._pending)}
+
+
+write_behind = WriteBehind()
+"""
+延迟写入队列实例，使用方法：
+```
+>>>write_behind.increment(Model, {"group_id": 1}, "count") # 自增
+>>>write_behind.update(Model, {"group_id": 1}, name="xxx") # 更新
+>>>await write_behind.discard(Model, group_id=1) # 删除记录前丢弃
+>>>await write_behind.flush() # 立即写入
+```
+"""
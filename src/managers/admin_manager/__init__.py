@@ -26,6 +26,8 @@ from src.utils.browser import browser
 from src.utils.log import logger
 from src.utils.utils import GroupList_Async
 
+from .data_source import send_paged_list
+
 __plugin_meta__ = PluginMetadata(
     name="超级用户管理",
     description="用于各种superusers的指令",
@@ -213,12 +215,19 @@ async def _(bot: Bot, event: PrivateMessageEvent):
     """好友列表"""
     logger.info(f"<g>超级用户管理</g> | {event.user_id} | 请求好友列表")
     user_list = await bot.get_friend_list()
-    num = len(user_list)
-    pagename = "好友列表.html"
-    img = await browser.template_to_image(
-        pagename=pagename, num=num, user_list=user_list
+
+    async def fetch(offset: int, limit: int) -> list[dict]:
+        return user_list[offset : offset + limit]
+
+    await send_paged_list(
+        bot,
+        user_id=event.user_id,
+        pagename="好友列表.html",
+        list_name="user_list",
+        total=len(user_list),
+        fetch=fetch,
     )
-    await friend_list.finish(MessageSegment.image(img))
+    await friend_list.finish()
 
 
 @friend_delete.handle()
@@ -245,12 +254,15 @@ async def _(bot: Bot, user_id: int = Depends(get_value)):
 async def _(bot: Bot, event: PrivateMessageEvent):
     """群列表"""
     logger.info(f"<g>超级用户管理</g> | {event.user_id} | 请求群列表")
-    get_group_list = await GroupInfo.get_group_list()
-    pagename = "群列表.html"
-    img = await browser.template_to_image(
-        pagename=pagename, num=len(get_group_list), group_list=get_group_list
+    await send_paged_list(
+        bot,
+        user_id=event.user_id,
+        pagename="群列表.html",
+        list_name="group_list",
+        total=await GroupInfo.get_group_count(),
+        fetch=GroupInfo.get_group_list,
     )
-    await group_list.finish(MessageSegment.image(img))
+    await group_list.finish()
 
 
 @group_delete.handle()
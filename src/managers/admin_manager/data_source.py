@@ -0,0 +1,71 @@
+import asyncio
+import math
+from typing import Awaitable, Callable
+
+from nonebot.adapters.onebot.v11 import Bot, Message, MessageSegment
+
+from src.utils.browser import browser
+from src.utils.log import logger
+
+LIST_PAGE_SIZE = 50
+"""列表每张图片的行数"""
+
+LIST_FORWARD_SIZE = 10
+"""每条合并转发消息的图片数，同一批图片会并发渲染"""
+
+
+async def send_paged_list(
+    bot: Bot,
+    user_id: int,
+    pagename: str,
+    list_name: str,
+    total: int,
+    fetch: Callable[[int, int], Awaitable[list]],
+    **kwargs,
+):
+    """
+    说明:
+        分页渲染列表并以合并转发消息发送，每次只获取和渲染一批页面，
+        列表再长内存中也最多只有一批图片
+
+    参数:
+        * `bot`：发送的机器人
+        * `user_id`：接收的用户QQ
+        * `pagename`：模板文件名，模板使用`num`，`page`，`pages`和列表数据渲染
+        * `list_name`：列表数据在模板中的变量名
+        * `total`：列表总行数
+        * `fetch`：获取一页数据的函数，参数为(offset, limit)
+        * `**kwargs`：其他注入模板的数据
+    """
+    pages = max(math.ceil(total / LIST_PAGE_SIZE), 1)
+    nickname = list(bot.config.nickname)[0] if bot.config.nickname else "机器人"
+    for batch_start in range(1, pages + 1, LIST_FORWARD_SIZE):
+        batch_end = min(batch_start + LIST_FORWARD_SIZE, pages + 1)
+
+        async def render(page: int) -> bytes:
+            data_list = await fetch((page - 1) * LIST_PAGE_SIZE, LIST_PAGE_SIZE)
+            return await browser.template_to_image(
+                pagename=pagename,
+                num=total,
+                page=page,
+                pages=pages,
+                **{list_name: data_list},
+                **kwargs,
+            )
+
+        images = await asyncio.gather(
+            *(render(page) for page in range(batch_start, batch_end))
+        )
+        chain = [
+            {
+                "type": "node",
+                "data": {
+                    "name": nickname,
+                    "uin": bot.self_id,
+                    "content": Message(MessageSegment.image(image)),
+                },
+            }
+            for image in images
+        ]
+        logger.debug(f"<g>分页列表</g> | {pagename} | 发送第{batch_start}-{batch_end - 1}页")
+        await bot.send_private_forward_msg(user_id=user_id, messages=chain)
@@ -282,12 +282,11 @@ async def _(bot: Bot, event: GroupIncreaseNoticeEvent):
     await plugin_manager.load_plugins(group_id)
     # 注册成员信息
     member_list = await bot.get_group_member_list(group_id=group_id)
-    for one_member in member_list:
-        user_id = one_member["user_id"]
-        user_name = (
-            one_member["nickname"] if one_member["card"] == "" else one_member["card"]
-        )
-        await UserInfo.user_init(user_id, group_id, user_name)
+    members = {
+        one_member["user_id"]: one_member["card"] or one_member["nickname"]
+        for one_member in member_list
+    }
+    await UserInfo.sync_members(group_id, members)
 
     # 给管理员发送消息
     superusers = list(bot.config.superusers)
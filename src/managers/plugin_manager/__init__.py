@@ -68,6 +68,8 @@ def get_group_setting(matcher: Matcher, regex_dict: dict = RegexDict()) -> Group
             return GroupSetting.抓马监控
         case "扶摇监控":
             return GroupSetting.扶摇监控
+        case "奇遇合并":
+            return GroupSetting.奇遇合并
         case _:
             matcher.skip()
 
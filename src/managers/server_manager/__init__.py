@@ -1,22 +1,28 @@
 import asyncio
-import random
+from typing import Optional
 
 from nonebot import get_driver, on, on_regex
-from nonebot.adapters.onebot.v11 import Bot, PrivateMessageEvent
+from nonebot.adapters.onebot.v11 import Bot, MessageEvent, PrivateMessageEvent
+from nonebot.message import run_postprocessor
 from nonebot.permission import SUPERUSER
 from nonebot.plugin import PluginMetadata
 from tortoise import Tortoise
 
+from src.internal.jx3api import JX3API
 from src.internal.plugin_manager import plugin_manager
+from src.internal.write_behind import write_behind
 from src.modules.group_info import GroupInfo
 from src.modules.user_info import UserInfo
 from src.params import PluginConfig
-from src.utils.browser import browser
+from src.utils.browser import RenderError, browser
 from src.utils.log import logger
 from src.utils.utils import GroupList_Async
 
 from ._jx3_event import RecvEvent, WsNotice
-from .data_source import get_ws_status, ws_init
+from .data_source import get_event_setting, get_push_groups, ws_init
+from .delivery import delivery
+from .digest import digest
+from .ingest import ingest
 from .jx3_websocket import ws_client
 
 __plugin_meta__ = PluginMetadata(
@@ -29,6 +35,12 @@ __plugin_meta__ = PluginMetadata(
 
 driver = get_driver()
 
+api = JX3API()
+"""jx3api接口实例"""
+
+REGISTER_CONCURRENCY = 5
+"""机器人连接时同时注册的群数量"""
+
 # ----------------------------------------------------------------
 #   bot服务的各种hook
 # ----------------------------------------------------------------
@@ -40,23 +52,28 @@ async def _(bot: Bot):
     # 获取群
     logger.info(f"<y>Bot {bot.self_id}</y> 已连接，正在注册...")
     group_list = await bot.get_group_list()
-    for group in group_list:
+    semaphore = asyncio.Semaphore(REGISTER_CONCURRENCY)
+
+    async def register_group(group: dict):
         group_id: int = group["group_id"]
         group_name: str = group["group_name"]
-        # 注册群信息
-        await GroupInfo.group_init(group_id, group_name)
-        # 注册插件
-        await plugin_manager.load_plugins(group_id)
-        # 注册成员信息
-        member_list = await bot.get_group_member_list(group_id=group_id)
-        for one_member in member_list:
-            user_id = one_member["user_id"]
-            user_name = (
-                one_member["nickname"]
-                if one_member["card"] == ""
-                else one_member["card"]
-            )
-            await UserInfo.user_init(user_id, group_id, user_name)
+        async with semaphore:
+            try:
+                # 注册群信息
+                await GroupInfo.group_init(group_id, group_name)
+                # 注册插件
+                await plugin_manager.load_plugins(group_id)
+                # 注册成员信息
+                member_list = await bot.get_group_member_list(group_id=group_id)
+                members = {
+                    one_member["user_id"]: one_member["card"] or one_member["nickname"]
+                    for one_member in member_list
+                }
+                await UserInfo.sync_members(group_id, members)
+            except Exception as e:
+                logger.error(f"<r>注册群({group_id})失败：{str(e)}</r>")
+
+    await asyncio.gather(*(register_group(group) for group in group_list))
     logger.info(f"<y>Bot {bot.self_id}</y> 注册完毕。")
 
 
@@ -80,17 +97,28 @@ async def _():
 async def _():
     """结束进程"""
     logger.info("检测到进程关闭，正在清理...")
+    logger.info("<y>关闭ws链接...</y>")
+    await ws_client.close()
+    await ingest.close()
+    await digest.close()
+    await delivery.close()
+    logger.info("<g>ws链接关闭成功。</g>")
+
     logger.info("<y>正在关闭浏览器...</y>")
     await browser.shutdown()
     logger.info("<g>浏览器关闭成功。</g>")
 
     logger.info("<y>正在关闭数据库...</y>")
+    await write_behind.close()
     await Tortoise.close_connections()
     logger.info("<g>数据库关闭成功。</g>")
 
-    logger.info("<y>关闭ws链接...</y>")
-    await ws_client.close()
-    logger.info("<g>ws链接关闭成功。</g>")
+
+@run_postprocessor
+async def _(bot: Bot, event: MessageEvent, exception: Optional[Exception]):
+    """渲染排队已满或者超时，给用户回复提示"""
+    if isinstance(exception, RenderError):
+        await bot.send(event, exception.message)
 
 
 # ----------------------------------------------------------------
@@ -99,15 +127,43 @@ async def _():
 check_ws = on_regex(pattern=r"^查看连接$", permission=SUPERUSER, priority=2, block=True)
 connect_ws = on_regex(pattern=r"^连接服务$", permission=SUPERUSER, priority=2, block=True)
 close_ws = on_regex(pattern=r"^关闭连接$", permission=SUPERUSER, priority=2, block=True)
+check_status = on_regex(pattern=r"^运行状态$", permission=SUPERUSER, priority=2, block=True)
+
+
+def _format_seconds(seconds: float) -> str:
+    """把秒数转换为x天x小时x分钟"""
+    minutes = int(seconds) // 60
+    days, minutes = divmod(minutes, 1440)
+    hours, minutes = divmod(minutes, 60)
+    if days:
+        return f"{days}天{hours}小时{minutes}分钟"
+    if hours:
+        return f"{hours}小时{minutes}分钟"
+    return f"{minutes}分钟"
 
 
 @check_ws.handle()
 async def _(event: PrivateMessageEvent):
     """查看连接"""
-    if ws_client.closed:
-        msg = "jx3api > ws连接已关闭！"
+    status = ws_client.get_status()
+    if status["connected"]:
+        msg = (
+            "jx3api > ws连接正常！\n"
+            f"本次已连接 {_format_seconds(status['uptime'])}\n"
+            f"最近消息 {status['last_frame']:.0f} 秒前\n"
+        )
+    elif status["connecting"]:
+        msg = f"jx3api > ws正在重连，已连续失败 {status['failures']} 次\n"
     else:
-        msg = "jx3api > ws连接正常！"
+        msg = "jx3api > ws连接已关闭！\n"
+    msg += (
+        f"累计在线 {_format_seconds(status['total_uptime'])}\n"
+        f"断线重连 {status['reconnects']} 次"
+    )
+    if status["history"]:
+        msg += "\n最近记录："
+        for record_time, record in status["history"]:
+            msg += f"\n{record_time.strftime('%m-%d %H:%M:%S')} {record}"
     await check_ws.finish(msg)
 
 
@@ -122,20 +178,77 @@ async def _(event: PrivateMessageEvent):
 
     await connect_ws.send("正在连接服务器...")
     flag = await ws_client.init()
-    msg = None
     if flag:
         msg = "jx3api > ws已连接！"
+    else:
+        msg = "jx3api > ws连接失败，正在后台持续重连，可以发送“查看连接”查看状态。"
     await connect_ws.finish(msg)
 
 
 @close_ws.handle()
 async def _(event: PrivateMessageEvent):
     """关闭连接"""
-    if not ws_client.closed:
+    if not ws_client.closed or ws_client.is_connecting:
         await ws_client.close()
     await close_ws.finish()
 
 
+@check_status.handle()
+async def _(event: PrivateMessageEvent):
+    """查看运行状态"""
+    api_stats = api.get_stats()
+    msg = (
+        "jx3api请求统计：\n"
+        f"总请求 {api_stats['requests']} 次\n"
+        f"缓存命中 {api_stats['cache_hits']} 次\n"
+        f"合并请求 {api_stats['coalesced']} 次\n"
+        f"实际请求 {api_stats['upstream']} 次\n"
+        f"合并率 {api_stats['coalesce_ratio']:.1%}\n"
+        f"预热 {api_stats['warmed']} 次，预热后命中 {api_stats['warm_hits']} 次\n"
+    )
+    ingest_stats = ingest.get_stats()
+    msg += (
+        "\nws接收统计：\n"
+        f"收到消息 {ingest_stats['received']} 条，排队 {ingest_stats['queued']} 条\n"
+        f"处理完成 {ingest_stats['processed']} 条，丢弃 {ingest_stats['dropped']} 条，"
+        f"重复 {ingest_stats['duplicated']} 条，解析失败 {ingest_stats['failed']} 条\n"
+        f"平均处理 {ingest_stats['latency_avg']:.2f} 秒，最慢 {ingest_stats['latency_max']:.2f} 秒\n"
+    )
+    push_stats = delivery.get_stats()
+    msg += (
+        "\nws推送统计：\n"
+        f"分发事件 {push_stats['events']} 个，进行中 {push_stats['running']} 个\n"
+        f"发送成功 {push_stats['success']} 条\n"
+        f"发送失败 {push_stats['failed']} 条\n"
+        f"平均送达 {push_stats['latency_avg']:.2f} 秒\n"
+        f"最慢送达 {push_stats['latency_max']:.2f} 秒\n"
+        f"上次分发用时 {push_stats['last_fanout']:.2f} 秒\n"
+    )
+    digest_stats = digest.get_stats()
+    msg += (
+        f"合并推送 {digest_stats['buffered']} 条，合并后发送 {digest_stats['sent']} 条，"
+        f"等待合并 {digest_stats['pending']} 条\n"
+    )
+    render_stats = browser.get_stats()
+    msg += (
+        "\n图片渲染统计：\n"
+        f"浏览器 {render_stats['workers']} 个，重启 {render_stats['restarts']} 次\n"
+        f"正在渲染 {render_stats['running']} 个，排队 {render_stats['depth']} 个\n"
+        f"累计渲染 {render_stats['jobs']} 次，排过队 {render_stats['queued']} 次\n"
+        f"拒绝 {render_stats['rejected']} 次，超时 {render_stats['timeouts']} 次\n"
+        f"平均排队 {render_stats['wait_avg']:.2f} 秒，最长 {render_stats['wait_max']:.2f} 秒\n"
+    )
+    write_stats = write_behind.get_stats()
+    msg += (
+        "\n延迟写入统计：\n"
+        f"入队操作 {write_stats['queued']} 次\n"
+        f"批量写入 {write_stats['flushes']} 次，共 {write_stats['rows']} 条\n"
+        f"待写入 {write_stats['pending']} 条\n"
+        f"上次写入用时 {write_stats['last_flush']:.3f} 秒"
+    )
+    await check_status.finish(msg)
+
+
 # ----------------------------------------------------------------
 #       ws消息事件处理
 # ----------------------------------------------------------------
@@ -147,22 +260,16 @@ ws_notice = on(type="WsNotice", priority=4, block=True)
 @ws_recev.handle()
 async def _(bot: Bot, event: RecvEvent):
     """ws推送事件"""
-    group_list = await bot.get_group_list()
-    async for group_id in GroupList_Async(group_list):
-        # 是否需要验证服务器
-        if event.server:
-            group_server = await GroupInfo.get_server(group_id)
-            if group_server != event.server:
-                continue
-
-        # 判断事件接受开启状态
-        status = await get_ws_status(group_id, event)
-        if status:
-            try:
-                await bot.send_group_msg(group_id=group_id, message=event.get_message())
-                await asyncio.sleep(random.uniform(0.3, 0.5))
-            except Exception:
-                pass
+    group_list = await get_push_groups(bot, event)
+    setting_type = get_event_setting(event)
+    digest_groups = digest.get_digest_groups(setting_type, group_list)
+    if digest_groups:
+        digest.add(bot, setting_type, digest_groups, event)
+        digest_set = set(digest_groups)
+        group_list = [group_id for group_id in group_list if group_id not in digest_set]
+    if group_list:
+        # 后台发送，进行中的分发达到上限时在这里等待，后续消息留在接收管道按优先级丢弃
+        await delivery.submit(bot, group_list, event.get_message())
     await ws_recev.finish()
 
 
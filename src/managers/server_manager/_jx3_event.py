@@ -1,12 +1,13 @@
 from abc import abstractmethod
 from datetime import datetime
-from typing import Literal, Optional
+from functools import lru_cache
+from typing import Any, Literal, Optional
 
 from nonebot.adapters import Event as BaseEvent
 from nonebot.adapters.onebot.v11.message import Message
 from nonebot.typing import overrides
 from nonebot.utils import escape_tag
-from pydantic import BaseModel, Extra, validator
+from pydantic import Extra, validator
 
 
 class EventRister:
@@ -24,22 +25,53 @@ class EventRister:
         return _rister
 
     @classmethod
-    def get_event(cls, ws_data: "WsData") -> Optional["RecvEvent"]:
-        event = cls.event_dict.get(ws_data.action)
+    def build_event(cls, action: int, data: dict[str, Any]) -> Optional["RecvEvent"]:
+        """
+        说明:
+            按消息类型直接构造事件
+
+        参数:
+            * `action`：ws消息类型
+            * `data`：消息数据
+
+        返回:
+            * `Optional[RecvEvent]`：事件，未注册的类型为None
+        """
+        event = cls.event_dict.get(action)
         if event:
-            return event.parse_obj(ws_data.data)
+            return event(**data)
         return None
 
 
-class WsData(BaseModel):
+@lru_cache(maxsize=1024)
+def format_timestamp(timestamp: int, fmt: str) -> str:
     """
-    ws数据模型
+    说明:
+        把时间戳格式化为字符串，同一秒的多条推送只转换一次
+
+    参数:
+        * `timestamp`：时间戳
+        * `fmt`：格式
+
+    返回:
+        * `str`：格式化后的时间
+    """
+    return datetime.fromtimestamp(timestamp).strftime(fmt)
+
+
+def time_validator(fmt: str):
     """
+    说明:
+        生成time字段的校验器，把推送中的时间戳转为字符串
 
-    action: int
-    """ws消息类型"""
-    data: dict
-    """消息数据"""
+    参数:
+        * `fmt`：时间格式
+    """
+
+    def check_time(cls, v):
+        return format_timestamp(int(v), fmt)
+
+    return validator("time", pre=True, allow_reuse=True)(check_time)
 
 
 class WsNotice(BaseEvent):
@@ -115,6 +147,10 @@ class RecvEvent(BaseEvent, extra=Extra.ignore):
     def get_message(self) -> Message:
         raise ValueError("Event has no message!")
 
+    def get_digest_line(self) -> str:
+        """合并推送时该事件的一行内容"""
+        return self.get_message().extract_plain_text().replace("\n", " ")
+
     @overrides(BaseEvent)
     def get_plaintext(self) -> str:
         raise ValueError("Event has no message!")
@@ -202,10 +238,7 @@ class SerendipityEvent(RecvEvent):
     time: str
     """触发时间"""
 
-    @validator("time", pre=True)
-    def check_time(cls, v):
-        start_trans = datetime.fromtimestamp(int(v))
-        return start_trans.strftime("%m/%d %H:%M")
+    _check_time = time_validator("%m/%d %H:%M")
 
     @property
     def log(self) -> str:
@@ -216,6 +249,10 @@ class SerendipityEvent(RecvEvent):
     def get_message(self) -> Message:
         return Message(f"奇遇推送 {self.time}\n{self.serendipity} 被 {self.name} 抱走惹。")
 
+    @overrides(RecvEvent)
+    def get_digest_line(self) -> str:
+        return f"{self.time} [{self.server}] {self.serendipity} 被 {self.name} 抱走惹。"
+
 
 @EventRister.rister(action=1002)
 class HorseRefreshEvent(RecvEvent):
@@ -232,10 +269,7 @@ class HorseRefreshEvent(RecvEvent):
     time: str
     """推送时间"""
 
-    @validator("time", pre=True)
-    def check_time(cls, v):
-        start_trans = datetime.fromtimestamp(int(v))
-        return start_trans.strftime("%H:%M:%S")
+    _check_time = time_validator("%H:%M:%S")
 
     @property
     def log(self) -> str:
@@ -264,10 +298,7 @@ class HorseCatchedEvent(RecvEvent):
     time: str
     """事件时间"""
 
-    @validator("time", pre=True)
-    def check_time(cls, v):
-        start_trans = datetime.fromtimestamp(int(v))
-        return start_trans.strftime("%H:%M:%S")
+    _check_time = time_validator("%H:%M:%S")
 
     @property
     def log(self) -> str:
@@ -290,10 +321,7 @@ class FuyaoRefreshEvent(RecvEvent):
     time: str
     """事件时间"""
 
-    @validator("time", pre=True)
-    def check_time(cls, v):
-        start_trans = datetime.fromtimestamp(int(v))
-        return start_trans.strftime("%H:%M:%S")
+    _check_time = time_validator("%H:%M:%S")
 
     @property
     def log(self) -> str:
@@ -316,10 +344,7 @@ class FuyaoNamedEvent(RecvEvent):
     time: str
     """点名时间"""
 
-    @validator("time", pre=True)
-    def check_time(cls, v):
-        start_trans = datetime.fromtimestamp(int(v))
-        return start_trans.strftime("%H:%M:%S")
+    _check_time = time_validator("%H:%M:%S")
 
     @property
     def log(self) -> str:
@@ -350,10 +375,7 @@ class FireworksEvent(RecvEvent):
     time: str
     """烟花使用时间"""
 
-    @validator("time", pre=True)
-    def check_time(cls, v):
-        start_trans = datetime.fromtimestamp(int(v))
-        return start_trans.strftime("%H:%M:%S")
+    _check_time = time_validator("%H:%M:%S")
 
     @property
     def log(self) -> str:
@@ -382,10 +404,7 @@ class XuanJingEvent(RecvEvent):
     time: str
     """获取时间"""
 
-    @validator("time", pre=True)
-    def check_time(cls, v):
-        start_trans = datetime.fromtimestamp(int(v))
-        return start_trans.strftime("%H:%M:%S")
+    _check_time = time_validator("%H:%M:%S")
 
     @property
     def log(self) -> str:
@@ -410,10 +429,7 @@ class GameSysMsgEvent(RecvEvent):
     time: str
     """消息时间"""
 
-    @validator("time", pre=True)
-    def check_time(cls, v):
-        start_trans = datetime.fromtimestamp(int(v))
-        return start_trans.strftime("%H:%M:%S")
+    _check_time = time_validator("%H:%M:%S")
 
     @property
     def log(self) -> str:
@@ -1,3 +1,7 @@
+from typing import Optional
+
+from nonebot.adapters.onebot.v11 import Bot
+
 from src.modules.group_info import GroupInfo
 from src.params import GroupSetting
 from src.utils.log import logger
@@ -13,39 +17,49 @@ async def ws_init():
     if flag:
         logger.info("<y>jx3api的ws服务器已链接。</y>")
     else:
-        logger.info("<r>jx3api的ws服务器连接失败！</r>")
+        logger.info("<r>jx3api的ws服务器连接失败，正在后台重连！</r>")
 
 
-async def get_ws_status(group_id: int, event: Event.RecvEvent) -> bool:
+def get_event_setting(event: Event.RecvEvent) -> Optional[GroupSetting]:
     """
     说明:
-        获取ws通知开关，robot为关闭时返回False
+        获取推送事件对应的群设置开关
 
     参数:
-        * `group_id`：QQ群号
         * `event`：接收事件类型
 
     返回:
-        * `bool`：ws通知开关
+        * `Optional[GroupSetting]`：群设置枚举，None为没有对应开关的事件
     """
-
-    bot_status = await GroupInfo.get_bot_status(group_id)
-    if not bot_status:
-        return False
-
     if isinstance(event, Event.ServerStatusEvent):
-        recv_type = GroupSetting.开服推送
+        return GroupSetting.开服推送
     if isinstance(event, Event.NewsRecvEvent):
-        recv_type = GroupSetting.新闻推送
+        return GroupSetting.新闻推送
     if isinstance(event, Event.SerendipityEvent):
-        recv_type = GroupSetting.奇遇推送
-    if isinstance(event, Event.HorseRefreshEvent) or isinstance(
-        event, Event.HorseCatchedEvent
-    ):
-        recv_type = GroupSetting.抓马监控
-    if isinstance(event, Event.FuyaoRefreshEvent) or isinstance(
-        event, Event.FuyaoNamedEvent
-    ):
-        recv_type = GroupSetting.扶摇监控
-
-    return await GroupInfo.get_config_status(group_id, recv_type)
+        return GroupSetting.奇遇推送
+    if isinstance(event, (Event.HorseRefreshEvent, Event.HorseCatchedEvent)):
+        return GroupSetting.抓马监控
+    if isinstance(event, (Event.FuyaoRefreshEvent, Event.FuyaoNamedEvent)):
+        return GroupSetting.扶摇监控
+    return None
+
+
+async def get_push_groups(bot: Bot, event: Event.RecvEvent) -> list[int]:
+    """
+    说明:
+        获取需要推送事件的群，需要机器人在群内、机器人开启、打开了对应推送，
+        且事件有服务器时绑定了该服务器
+
+    参数:
+        * `bot`：机器人
+        * `event`：接收事件类型
+
+    返回:
+        * `list[int]`：群号列表
+    """
+    setting_type = get_event_setting(event)
+    if setting_type is None:
+        return []
+    group_list = GroupInfo.get_push_groups(setting_type, event.server)
+    bot_groups = {group["group_id"] for group in await bot.get_group_list()}
+    return [group_id for group_id in group_list if group_id in bot_groups]
@@ -0,0 +1,217 @@
+import asyncio
+import time
+
+from nonebot.adapters.onebot.v11 import Bot, Message
+
+from src.config import push_config
+from src.utils.log import logger
+
+
+class TokenBucket:
+    """
+    令牌桶限速器，平均每秒发放`rate`个令牌，最多积攒`capacity`个
+    """
+
+    _rate: float
+    """每秒令牌数"""
+    _capacity: int
+    """令牌桶容量"""
+    _tokens: float
+    """当前令牌数"""
+    _updated: float
+    """上次计算令牌的时间"""
+    _lock: asyncio.Lock
+    """获取令牌的锁，保证先来先得"""
+
+    def __init__(self, rate: float, capacity: int):
+        self._rate = max(rate, 0.01)
+        self._capacity = max(capacity, 1)
+        self._tokens = self._capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        """
+        说明:
+            获取一个令牌，没有令牌时等待
+        """
+        async with self._lock:
+            while True:
+                time_now = time.monotonic()
+                passed = time_now - self._updated
+                self._tokens = min(self._capacity, self._tokens + passed * self._rate)
+                self._updated = time_now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self._rate)
+
+
+class DeliveryEngine:
+    """
+    推送分发器，把一条消息并发发送给多个群
+
+    每个机器人使用单独的令牌桶限速，同时进行中的发送数和后台分发数都有上限，
+    后台分发数达到上限时提交方等待，消息留在接收管道中排队，由接收管道按优先级丢弃。
+    单个群发送失败不影响其他群。
+    """
+
+    _buckets: dict[str, TokenBucket]
+    """每个机器人的限速器"""
+    _senders: dict[str, asyncio.Semaphore]
+    """每个机器人同时进行中的发送数"""
+    _slots: dict[str, asyncio.Semaphore]
+    """每个机器人后台进行中的分发数"""
+    _tasks: set[asyncio.Task]
+    """后台进行中的分发"""
+    _stats: dict[str, float]
+    """分发统计"""
+
+    def __new__(cls, *args, **kwargs):
+        """单例"""
+        if not hasattr(cls, "_instance"):
+            orig = super(DeliveryEngine, cls)
+            cls._instance = orig.__new__(cls, *args, **kwargs)
+        return cls._instance
+
+    def __init__(self):
+        self._buckets = {}
+        self._senders = {}
+        self._slots = {}
+        self._tasks = set()
+        self._stats = {
+            "events": 0,
+            "success": 0,
+            "failed": 0,
+            "latency_sum": 0.0,
+            "latency_max": 0.0,
+            "last_fanout": 0.0,
+        }
+
+    def _get_bucket(self, bot_id: str) -> TokenBucket:
+        """获取机器人的限速器"""
+        bucket = self._buckets.get(bot_id)
+        if bucket is None:
+            bucket = TokenBucket(push_config.rate, push_config.burst)
+            self._buckets[bot_id] = bucket
+        return bucket
+
+    def _get_sender(self, bot_id: str) -> asyncio.Semaphore:
+        """获取机器人的发送并发限制"""
+        sender = self._senders.get(bot_id)
+        if sender is None:
+            sender = asyncio.Semaphore(max(push_config.concurrency, 1))
+            self._senders[bot_id] = sender
+        return sender
+
+    def _get_slots(self, bot_id: str) -> asyncio.Semaphore:
+        """获取机器人的后台分发数限制"""
+        slots = self._slots.get(bot_id)
+        if slots is None:
+            slots = asyncio.Semaphore(max(push_config.delivery_backlog, 1))
+            self._slots[bot_id] = slots
+        return slots
+
+    async def deliver(self, bot: Bot, group_list: list[int], message: Message):
+        """
+        说明:
+            给多个群发送同一条消息
+
+        参数:
+            * `bot`：发送的机器人
+            * `group_list`：群号列表
+            * `message`：消息内容
+        """
+        bucket = self._get_bucket(bot.self_id)
+        sender = self._get_sender(bot.self_id)
+        time_start = time.monotonic()
+        groups = iter(group_list)
+        results = {"success": 0, "failed": 0}
+
+        async def send_worker():
+            # 几个worker依次领取群号发送，不为每个群单独创建协程
+            for group_id in groups:
+                async with sender:
+                    await bucket.acquire()
+                    try:
+                        await bot.send_group_msg(group_id=group_id, message=message)
+                    except Exception as e:
+                        logger.debug(f"推送失败 | 群{group_id} | {str(e)}")
+                        results["failed"] += 1
+                        continue
+                latency = time.monotonic() - time_start
+                self._stats["latency_sum"] += latency
+                self._stats["latency_max"] = max(self._stats["latency_max"], latency)
+                results["success"] += 1
+
+        worker_num = min(max(push_config.concurrency, 1), len(group_list))
+        await asyncio.gather(*(send_worker() for _ in range(worker_num)))
+        self._stats["events"] += 1
+        self._stats["success"] += results["success"]
+        self._stats["failed"] += results["failed"]
+        self._stats["last_fanout"] = time.monotonic() - time_start
+
+    async def submit(self, bot: Bot, group_list: list[int], message: Message):
+        """
+        说明:
+            在后台给多个群发送同一条消息，不等待发送完成；
+            机器人后台进行中的分发数达到上限时，等待有分发完成后再提交
+
+        参数:
+            * `bot`：发送的机器人
+            * `group_list`：群号列表
+            * `message`：消息内容
+        """
+        slots = self._get_slots(bot.self_id)
+        await slots.acquire()
+        task = asyncio.create_task(self.deliver(bot, group_list, message))
+        self._tasks.add(task)
+
+        def _done(task: asyncio.Task):
+            self._tasks.discard(task)
+            slots.release()
+
+        task.add_done_callback(_done)
+
+    async def close(self):
+        """停止后台进行中的分发"""
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = set()
+
+    def get_stats(self) -> dict[str, float]:
+        """
+        说明:
+            获取分发统计
+
+        返回:
+            * `dict[str, float]`：统计数据
+                * `events`：分发完成的事件数
+                * `running`：后台进行中的分发数
+                * `success`：发送成功数
+                * `failed`：发送失败数
+                * `latency_avg`：从开始分发到发送成功的平均耗时，秒
+                * `latency_max`：最大耗时，秒
+                * `last_fanout`：上一次分发总耗时，秒
+        """
+        success = self._stats["success"]
+        return {
+            "events": self._stats["events"],
+            "running": len(self._tasks),
+            "success": success,
+            "failed": self._stats["failed"],
+            "latency_avg": self._stats["latency_sum"] / success if success else 0.0,
+            "latency_max": self._stats["latency_max"],
+            "last_fanout": self._stats["last_fanout"],
+        }
+
+
+delivery = DeliveryEngine()
+"""
+推送分发器实例，使用方法：
+```
+>>>await delivery.deliver(bot, group_list, message) # 分发消息
+>>>await delivery.submit(bot, group_list, message) # 后台分发消息
+>>>delivery.get_stats() # 分发统计
+```
+"""
@@ -0,0 +1,205 @@
+import asyncio
+from typing import Optional
+
+from nonebot.adapters.onebot.v11 import Bot, Message
+
+from src.config import push_config
+from src.modules.group_info import GroupInfo
+from src.params import GroupSetting
+from src.utils.log import logger
+
+from ._jx3_event import RecvEvent
+from .delivery import delivery
+
+DIGEST_SETTINGS: dict[GroupSetting, GroupSetting] = {
+    GroupSetting.奇遇推送: GroupSetting.奇遇合并,
+}
+"""推送开关对应的合并开关，群打开合并开关后该类推送攒一段时间合并发送"""
+
+DIGEST_MAX_LINES = 30
+"""每条合并消息最多的行数，超出时分成多条"""
+
+DIGEST_CLOSE_TIMEOUT = 5
+"""关闭时发送攒下推送的最长时间，秒，超时后丢弃剩余推送"""
+
+
+class DigestBuffer:
+    """
+    合并推送缓冲，打开了合并开关的群，同类推送在时间窗口内攒起来合并成一条消息
+
+    每个机器人的每类推送各有一个时间窗口，从窗口内第一条推送开始计时；
+    窗口结束时攒下内容相同的群一起分发。
+    """
+
+    _buffers: dict[tuple[str, GroupSetting], dict[int, list[str]]]
+    """(机器人, 推送开关): {群号: 攒下的推送内容}"""
+    _timers: dict[tuple[str, GroupSetting], asyncio.Task]
+    """等待窗口结束的任务"""
+    _bots: dict[str, Bot]
+    """发送的机器人"""
+    _stats: dict[str, int]
+    """合并统计"""
+
+    def __new__(cls, *args, **kwargs):
+        """单例"""
+        if not hasattr(cls, "_instance"):
+            orig = super(DigestBuffer, cls)
+            cls._instance = orig.__new__(cls, *args, **kwargs)
+        return cls._instance
+
+    def __init__(self):
+        self._buffers = {}
+        self._timers = {}
+        self._bots = {}
+        self._stats = {"buffered": 0, "sent": 0}
+
+    def get_digest_groups(
+        self, setting_type: Optional[GroupSetting], group_list: list[int]
+    ) -> list[int]:
+        """
+        说明:
+            筛选出需要合并推送的群
+
+        参数:
+            * `setting_type`：推送开关，None为没有对应开关的事件
+            * `group_list`：需要推送的群号列表
+
+        返回:
+            * `list[int]`：打开了合并开关的群号列表
+        """
+        digest_setting = DIGEST_SETTINGS.get(setting_type)
+        if digest_setting is None or push_config.digest_window <= 0:
+            return []
+        return GroupInfo.filter_setting_groups(group_list, digest_setting)
+
+    def add(
+        self,
+        bot: Bot,
+        setting_type: GroupSetting,
+        group_list: list[int],
+        event: RecvEvent,
+    ):
+        """
+        说明:
+            把一条推送放入合并缓冲，窗口结束时发送
+
+        参数:
+            * `bot`：发送的机器人
+            * `setting_type`：推送开关
+            * `group_list`：需要合并推送的群号列表
+            * `event`：推送事件
+        """
+        key = (bot.self_id, setting_type)
+        buffer = self._buffers.setdefault(key, {})
+        line = event.get_digest_line()
+        for group_id in group_list:
+            buffer.setdefault(group_id, []).append(line)
+        self._bots[bot.self_id] = bot
+        self._stats["buffered"] += len(group_list)
+        if key not in self._timers:
+            self._timers[key] = asyncio.create_task(self._flush_later(key))
+
+    async def _flush_later(self, key: tuple[str, GroupSetting]):
+        """等待窗口结束后发送"""
+        await asyncio.sleep(push_config.digest_window)
+        self._timers.pop(key, None)
+        await self._flush(key)
+
+    async def _flush(self, key: tuple[str, GroupSetting]):
+        """
+        说明:
+            发送一个缓冲中攒下的推送，内容相同的群一起分发
+        """
+        buffer = self._buffers.pop(key, None)
+        bot = self._bots.get(key[0])
+        if not buffer or bot is None:
+            return
+        same_groups: dict[tuple[str, ...], list[int]] = {}
+        for group_id, lines in buffer.items():
+            same_groups.setdefault(tuple(lines), []).append(group_id)
+        for lines, group_list in same_groups.items():
+            for message in self._build_messages(key[1], lines):
+                await delivery.deliver(bot, group_list, message)
+                self._stats["sent"] += len(group_list)
+        logger.debug(
+            f"<g>合并推送</g> | {key[1].name} | 发送{len(buffer)}个群，{len(same_groups)}种内容"
+        )
+
+    @staticmethod
+    def _build_messages(
+        setting_type: GroupSetting, lines: tuple[str, ...]
+    ) -> list[Message]:
+        """
+        说明:
+            把攒下的推送内容拼成合并消息，行数太多时分成多条
+
+        参数:
+            * `setting_type`：推送开关
+            * `lines`：推送内容
+
+        返回:
+            * `list[Message]`：合并消息
+        """
+        messages = []
+        for start in range(0, len(lines), DIGEST_MAX_LINES):
+            chunk = lines[start : start + DIGEST_MAX_LINES]
+            title = (
+                f"[{setting_type.name}] 最近{push_config.digest_window}秒共{len(lines)}条"
+            )
+            if len(lines) > DIGEST_MAX_LINES:
+                title += f"（{start + 1}-{start + len(chunk)}）"
+            messages.append(Message("\n".join((title, *chunk))))
+        return messages
+
+    async def _flush_all(self):
+        """发送所有攒下的推送"""
+        for key in list(self._buffers):
+            try:
+                await self._flush(key)
+            except Exception as e:
+                logger.error(f"<r>合并推送发送失败</r> | {str(e)}")
+
+    async def close(self):
+        """停止等待，立即发送攒下的推送，超过时间限制时丢弃剩余推送"""
+        for timer in self._timers.values():
+            timer.cancel()
+        self._timers = {}
+        try:
+            await asyncio.wait_for(self._flush_all(), timeout=DIGEST_CLOSE_TIMEOUT)
+        except asyncio.TimeoutError:
+            dropped = self.get_stats()["pending"]
+            logger.error(f"<r>合并推送发送超时，丢弃剩余 {dropped} 条群消息</r>")
+        self._buffers = {}
+
+    def get_stats(self) -> dict[str, int]:
+        """
+        说明:
+            获取合并统计
+
+        返回:
+            * `dict[str, int]`：统计数据
+                * `buffered`：合并前的群消息数
+                * `sent`：合并后实际发送的群消息数
+                * `pending`：等待合并的群消息数
+        """
+        return {
+            "buffered": self._stats["buffered"],
+            "sent": self._stats["sent"],
+            "pending": sum(
+                len(lines)
+                for buffer in self._buffers.values()
+                for lines in buffer.values()
+            ),
+        }
+
+
+digest = DigestBuffer()
+"""
+合并推送缓冲实例，使用方法：
+```
+>>>digest.get_digest_groups(setting_type, group_list) # 需要合并推送的群
+>>>digest.add(bot, setting_type, group_list, event) # 放入缓冲
+>>>digest.get_stats() # 合并统计
+>>>await digest.close() # 立即发送并关闭
+```
+"""
@@ -0,0 +1,390 @@
+import asyncio
+import hashlib
+import json
+import time
+from collections import OrderedDict, deque
+from typing import Any
+
+from nonebot import get_bots
+from nonebot.message import handle_event
+
+from src.config import push_config
+from src.utils.log import logger
+
+from ._jx3_event import EventRister
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def json_loads(message: str | bytes) -> Any:
+    """解析json，安装了orjson时使用orjson"""
+    if orjson is not None:
+        return orjson.loads(message)
+    return json.loads(message)
+
+
+def json_dumps_sorted(data: Any) -> bytes:
+    """按键排序序列化json，用于计算消息指纹"""
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_SORT_KEYS)
+    return json.dumps(
+        data, sort_keys=True, ensure_ascii=False, separators=(",", ":")
+    ).encode("utf-8")
+
+
+PRIORITY_HIGH = 0
+"""开服、新闻、订阅回执等需要及时送达的消息"""
+PRIORITY_NORMAL = 1
+"""抓马、扶摇等有时效的消息"""
+PRIORITY_LOW = 2
+"""奇遇、烟花等数量多的消息，队列满时最先丢弃"""
+
+EVENT_PRIORITY: dict[int, int] = {
+    2001: PRIORITY_HIGH,
+    2002: PRIORITY_HIGH,
+    10001: PRIORITY_HIGH,
+    10002: PRIORITY_HIGH,
+    1002: PRIORITY_NORMAL,
+    1003: PRIORITY_NORMAL,
+    1004: PRIORITY_NORMAL,
+    1005: PRIORITY_NORMAL,
+    1001: PRIORITY_LOW,
+    1006: PRIORITY_LOW,
+    1007: PRIORITY_LOW,
+    1008: PRIORITY_LOW,
+}
+"""ws消息类型对应的优先级，未列出的为普通优先级"""
+
+DEDUP_EXCLUDE: set[int] = {10001, 10002}
+"""不去重的消息类型，订阅回执是对本机操作的回应，重复也应送达"""
+
+DEDUP_STATE: dict[int, str] = {2001: "server"}
+"""按状态去重的消息类型: 区分状态的字段，这类消息没有时间字段，只和同一字段值的上一条比较"""
+
+
+class IngestItem:
+    """排队中的ws消息"""
+
+    __slots__ = ("action", "data", "priority", "recv_time")
+
+    action: int
+    """消息类型"""
+    data: dict[str, Any]
+    """消息数据"""
+    priority: int
+    """优先级，数字越大越先丢弃"""
+    recv_time: float
+    """收到的时间"""
+
+    def __init__(self, action: int, data: dict[str, Any]):
+        self.action = action
+        self.data = data
+        self.priority = EVENT_PRIORITY.get(action, PRIORITY_NORMAL)
+        self.recv_time = time.monotonic()
+
+
+class DedupWindow:
+    """
+    重复消息过滤，记住一段时间内收到过的消息指纹
+
+    指纹为消息类型加上数据按键排序后的哈希，超过时间窗口或者数量上限时忘记最早的指纹。
+    没有时间字段的状态类消息（如开服推送）只和同一服务器的上一条比较，状态变了就不算重复。
+    """
+
+    _seen: OrderedDict[str, float]
+    """消息指纹: 过期时间，按收到的顺序排列"""
+    _states: dict[tuple[int, Any], tuple[str, float]]
+    """(消息类型, 状态字段值): (上一条的指纹, 过期时间)"""
+    _window: int
+    """时间窗口，秒"""
+    _size: int
+    """最多记住的指纹数"""
+
+    def __init__(self, window: int, size: int):
+        self._seen = OrderedDict()
+        self._states = {}
+        self._window = window
+        self._size = max(size, 1)
+
+    @staticmethod
+    def fingerprint(action: int, data: dict[str, Any]) -> str:
+        """
+        说明:
+            计算消息指纹
+
+        参数:
+            * `action`：消息类型
+            * `data`：消息数据
+
+        返回:
+            * `str`：消息指纹
+        """
+        digest = hashlib.blake2b(json_dumps_sorted(data), digest_size=16).hexdigest()
+        return f"{action}:{digest}"
+
+    def is_duplicate(self, action: int, data: dict[str, Any]) -> bool:
+        """
+        说明:
+            判断消息是否在时间窗口内收到过，没收到过的记下指纹
+
+        参数:
+            * `action`：消息类型
+            * `data`：消息数据
+
+        返回:
+            * `bool`：是否为重复消息
+        """
+        if self._window <= 0 or action in DEDUP_EXCLUDE:
+            return False
+        now = time.monotonic()
+        if action in DEDUP_STATE:
+            return self._is_same_state(action, data, now)
+
+        # 时间窗口相同，越早记下的越早过期
+        while self._seen:
+            key, expire = next(iter(self._seen.items()))
+            if expire > now:
+                break
+            self._seen.pop(key)
+
+        key = self.fingerprint(action, data)
+        if key in self._seen:
+            return True
+        self._seen[key] = now + self._window
+        if len(self._seen) > self._size:
+            self._seen.popitem(last=False)
+        return False
+
+    def _is_same_state(self, action: int, data: dict[str, Any], now: float) -> bool:
+        """
+        说明:
+            状态类消息是否和同一字段值的上一条相同，并记下这一条
+
+        参数:
+            * `action`：消息类型
+            * `data`：消息数据
+            * `now`：当前时间
+
+        返回:
+            * `bool`：是否为重复消息
+        """
+        state_key = (action, data.get(DEDUP_STATE[action]))
+        key = self.fingerprint(action, data)
+        last = self._states.get(state_key)
+        if last and last[0] == key and last[1] > now:
+            return True
+        self._states[state_key] = (key, now + self._window)
+        return False
+
+
+class IngestPipeline:
+    """
+    ws消息接收管道，收到的消息进入有界队列，由固定数量的分发worker处理
+
+    同一类型的消息总是分配给同一个worker，按收到的顺序处理；worker只负责解析和分发事件，
+    推送发送交给推送分发器在后台进行，大量群的推送不会阻塞后面的消息；
+    队列满时先丢弃最早的低优先级消息，消息洪峰时内存和延迟保持稳定；
+    重连或上游重发的重复消息在入队前丢弃，不会再推送一遍。
+    """
+
+    _shards: list[list[deque[IngestItem]]]
+    """每个worker的消息队列，每个优先级一个队列"""
+    _wakeups: list[asyncio.Event]
+    """有新消息时唤醒对应worker"""
+    _workers: list[asyncio.Task]
+    """分发worker"""
+    _capacity: int
+    """所有队列的总容量"""
+    _size: int
+    """当前排队的消息数"""
+    _dedup: DedupWindow
+    """重复消息过滤"""
+    _stats: dict[str, float]
+    """处理统计"""
+
+    def __new__(cls, *args, **kwargs):
+        """单例"""
+        if not hasattr(cls, "_instance"):
+            orig = super(IngestPipeline, cls)
+            cls._instance = orig.__new__(cls, *args, **kwargs)
+        return cls._instance
+
+    def __init__(self):
+        worker_num = max(push_config.ingest_workers, 1)
+        self._shards = [
+            [deque() for _ in range(PRIORITY_LOW + 1)] for _ in range(worker_num)
+        ]
+        self._wakeups = []
+        self._workers = []
+        self._capacity = max(push_config.ingest_queue_size, 1)
+        self._size = 0
+        self._dedup = DedupWindow(push_config.dedup_window, push_config.dedup_size)
+        self._stats = {
+            "received": 0,
+            "duplicated": 0,
+            "dropped": 0,
+            "processed": 0,
+            "failed": 0,
+            "latency_sum": 0.0,
+            "latency_max": 0.0,
+        }
+
+    def _start(self):
+        """启动分发worker"""
+        if self._workers:
+            return
+        self._wakeups = [asyncio.Event() for _ in self._shards]
+        self._workers = [
+            asyncio.create_task(self._run(index)) for index in range(len(self._shards))
+        ]
+
+    def _drop_one(self, priority: int) -> bool:
+        """
+        说明:
+            队列满时腾出一个位置，丢弃优先级最低的消息中最早收到的一条，
+            每个优先级的队列头就是该队列最早的消息，只需比较各worker的队列头
+
+        参数:
+            * `priority`：新消息的优先级
+
+        返回:
+            * `bool`：是否腾出了位置，新消息优先级比队列中所有消息都低时不丢弃
+        """
+        for drop_priority in range(PRIORITY_LOW, priority - 1, -1):
+            queues = [shard[drop_priority] for shard in self._shards]
+            queues = [queue for queue in queues if queue]
+            if not queues:
+                continue
+            victim_queue = min(queues, key=lambda queue: queue[0].recv_time)
+            victim_queue.popleft()
+            self._size -= 1
+            return True
+        return False
+
+    def put(self, message: str):
+        """
+        说明:
+            收到一条ws消息，解析类型后放入队列
+
+        参数:
+            * `message`：ws原始消息
+        """
+        self._stats["received"] += 1
+        try:
+            ws_obj = json_loads(message)
+            item = IngestItem(int(ws_obj["action"]), ws_obj.get("data") or {})
+        except Exception:
+            self._stats["failed"] += 1
+            logger.error(f"未知ws消息：<g>{message}</g>")
+            return
+        if self._dedup.is_duplicate(item.action, item.data):
+            self._stats["duplicated"] += 1
+            logger.debug(f"<g>ws_server</g> | 丢弃重复消息：{item.action}")
+            return
+
+        self._start()
+        if self._size >= self._capacity:
+            self._stats["dropped"] += 1
+            if not self._drop_one(item.priority):
+                return
+        index = item.action % len(self._shards)
+        self._shards[index][item.priority].append(item)
+        self._size += 1
+        self._wakeups[index].set()
+
+    async def _run(self, index: int):
+        """
+        说明:
+            分发worker，先处理高优先级的消息，同一优先级按收到的顺序处理，
+            同一类型的消息优先级相同，所以总是按顺序处理
+        """
+        shard = self._shards[index]
+        wakeup = self._wakeups[index]
+        while True:
+            queue = next((queue for queue in shard if queue), None)
+            if queue is None:
+                wakeup.clear()
+                await wakeup.wait()
+                continue
+            item = queue.popleft()
+            self._size -= 1
+            await self._dispatch(item)
+
+    async def _dispatch(self, item: IngestItem):
+        """
+        说明:
+            把一条消息转换成事件分发给所有机器人
+        """
+        try:
+            event = EventRister.build_event(item.action, item.data)
+        except Exception:
+            self._stats["failed"] += 1
+            logger.error(f"未知ws消息：<g>{item.data}</g>")
+            return
+        if event is None:
+            self._stats["failed"] += 1
+            logger.error(f"<r>未知的ws消息类型：{item.action}</r>")
+            return
+
+        logger.debug(event.log)
+        for _, one_bot in get_bots().items():
+            try:
+                await handle_event(one_bot, event)
+            except Exception as e:
+                logger.error(f"<r>ws事件处理出错</r> | {str(e)}")
+        latency = time.monotonic() - item.recv_time
+        self._stats["processed"] += 1
+        self._stats["latency_sum"] += latency
+        self._stats["latency_max"] = max(self._stats["latency_max"], latency)
+
+    async def close(self):
+        """停止分发worker，丢弃未处理的消息"""
+        for worker in self._workers:
+            worker.cancel()
+        self._workers = []
+        for shard in self._shards:
+            for queue in shard:
+                queue.clear()
+        self._size = 0
+
+    def get_stats(self) -> dict[str, float]:
+        """
+        说明:
+            获取接收统计
+
+        返回:
+            * `dict[str, float]`：统计数据
+                * `received`：收到的消息数
+                * `queued`：当前排队的消息数
+                * `duplicated`：时间窗口内重复而丢弃的消息数
+                * `dropped`：队列满时丢弃的消息数
+                * `processed`：分发完成的消息数
+                * `failed`：解析失败的消息数
+                * `latency_avg`：从收到到分发完成的平均耗时，秒
+                * `latency_max`：最大耗时，秒
+        """
+        processed = self._stats["processed"]
+        return {
+            "received": self._stats["received"],
+            "queued": self._size,
+            "duplicated": self._stats["duplicated"],
+            "dropped": self._stats["dropped"],
+            "processed": processed,
+            "failed": self._stats["failed"],
+            "latency_avg": self._stats["latency_sum"] / processed if processed else 0.0,
+            "latency_max": self._stats["latency_max"],
+        }
+
+
+ingest = IngestPipeline()
+"""
+ws消息接收管道实例，使用方法：
+```
+>>>ingest.put(message) # 收到ws消息
+>>>ingest.get_stats() # 接收统计
+>>>await ingest.close() # 关闭
+```
+"""
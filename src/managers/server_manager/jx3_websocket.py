@@ -1,5 +1,8 @@
 import asyncio
-import json
+import random
+import time
+from collections import deque
+from datetime import datetime
 from typing import Optional
 
 import websockets
@@ -11,18 +14,49 @@ from websockets.legacy.client import WebSocketClientProtocol
 from src.config import jx3api_config
 from src.utils.log import logger
 
-from ._jx3_event import EventRister, WsData, WsNotice
+from ._jx3_event import WsNotice
+from .ingest import ingest
+
+RETRY_BASE = 1
+"""重连的初始等待时间，秒"""
+
+HISTORY_SIZE = 10
+"""保留的连接记录条数"""
+
+WATCHDOG_INTERVAL = 30
+"""假死检查的间隔，秒"""
 
 
 class Jx3WebSocket(object):
     """
     jx3_api的ws链接封装
+
+    连接由一个守护任务维持：断开后按指数退避加随机抖动无限重连，
+    连续失败达到阈值时通知超级用户，长时间收不到消息时视为假死主动重连。
     """
 
     connect: Optional[WebSocketClientProtocol] = None
     """ws链接"""
-    is_connecting: bool = False
-    """是否正在连接"""
+    _supervisor: Optional[asyncio.Task] = None
+    """维持连接的守护任务"""
+    _failures: int = 0
+    """连续连接失败次数"""
+    _next_alert: int = 0
+    """下一次通知的连续失败次数"""
+    _alerted: bool = False
+    """是否已发出失败通知，恢复时再通知一次"""
+    _stalled: bool = False
+    """当前连接是否因假死被关闭"""
+    _last_frame: float = 0.0
+    """最近收到消息的时间"""
+    _connected_at: Optional[datetime] = None
+    """当前连接建立的时间"""
+    _uptime: float = 0.0
+    """之前各次连接的累计在线时间，秒"""
+    _reconnects: int = 0
+    """断线重连次数"""
+    _history: deque[tuple[datetime, str]]
+    """最近的连接记录"""
 
     def __new__(cls, *args, **kwargs):
         """单例"""
@@ -31,26 +65,146 @@ class Jx3WebSocket(object):
             cls._instance = orig.__new__(cls, *args, **kwargs)
         return cls._instance
 
-    async def _task(self):
+    def __init__(self):
+        self._history = deque(maxlen=HISTORY_SIZE)
+
+    def _record(self, message: str):
+        """记录一条连接记录"""
+        self._history.append((datetime.now(), message))
+
+    async def _connect(self) -> bool:
         """
         说明:
-            循环等待ws接受并分发任务
+            尝试连接一次ws服务器
+
+        返回:
+            * `bool`：是否连接成功
         """
+        headers = {"token": jx3api_config.ws_token or ""}
+        try:
+            logger.debug(f"<g>ws_server</g> | 正在开始第 {self._failures + 1} 次尝试")
+            self.connect = await websockets.connect(
+                uri=jx3api_config.ws_path,
+                extra_headers=headers,
+                ping_interval=20,
+                ping_timeout=20,
+                close_timeout=10,
+            )
+        except Exception as e:
+            logger.error(f"<r>链接到ws服务器时发生错误：{str(e)}</r>")
+            self.connect = None
+            self._failures += 1
+            if self._failures == 1:
+                self._record(f"连接失败：{str(e)}")
+            return False
+
+        logger.debug("<g>ws_server</g> | ws连接成功！")
+        self._connected_at = datetime.now()
+        self._last_frame = time.monotonic()
+        self._stalled = False
+        self._record("连接成功" if self._failures == 0 else f"连续失败 {self._failures} 次后连接成功")
+        self._failures = 0
+        self._next_alert = max(jx3api_config.ws_alert_failures, 1)
+        if self._alerted:
+            self._alerted = False
+            await self._raise_notice("jx3api > ws服务器已重新连接。")
+        return True
+
+    async def _task(self) -> str:
+        """
+        说明:
+            循环等待ws接受，消息放入接收管道排队分发，直到连接关闭
+
+        返回:
+            * `str`：连接关闭的原因
+        """
+        watchdog = asyncio.create_task(self._watchdog())
         try:
             while True:
                 msg = await self.connect.recv()
-                asyncio.create_task(self._handle_msg(msg))
+                self._last_frame = time.monotonic()
+                ingest.put(msg)
 
         except ConnectionClosedOK:
-            logger.debug("<g>jx3api > ws链接已主动关闭！</g>")
-            self.connect = None
-            await self._raise_notice("jx3api > ws已正常关闭！")
+            if self._stalled:
+                return "长时间没有收到消息，已主动断开"
+            return "连接被正常关闭"
 
         except ConnectionClosedError as e:
-            logger.error(f"<r>jx3api > ws链接异常关闭：{e.reason}</r>")
-            # 自启动
+            return f"连接异常关闭：{e.reason or e.code}"
+
+        finally:
+            watchdog.cancel()
+            if self._connected_at:
+                self._uptime += (datetime.now() - self._connected_at).total_seconds()
+                self._connected_at = None
             self.connect = None
-            await self.init()
+
+    async def _watchdog(self):
+        """
+        说明:
+            假死检查，心跳正常但长时间收不到消息时关闭连接，由守护任务重连
+        """
+        stall_time = jx3api_config.ws_stall_minutes * 60
+        if stall_time <= 0:
+            return
+        while True:
+            await asyncio.sleep(WATCHDOG_INTERVAL)
+            if time.monotonic() - self._last_frame < stall_time:
+                continue
+            logger.error(
+                f"<r>jx3api > ws已 {jx3api_config.ws_stall_minutes} 分钟没有收到消息，正在重连</r>"
+            )
+            self._stalled = True
+            if self.connect:
+                await self.connect.close()
+            return
+
+    def _get_delay(self) -> float:
+        """
+        说明:
+            获取下一次重连前的等待时间，按连续失败次数翻倍，加上随机抖动避免同时重连
+
+        返回:
+            * `float`：等待时间，秒
+        """
+        delay = min(
+            RETRY_BASE * 2 ** min(self._failures, 16), jx3api_config.ws_retry_max
+        )
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    async def _check_alert(self):
+        """连续失败次数达到阈值时通知超级用户，之后每翻倍一次再通知"""
+        if self._failures < self._next_alert:
+            return
+        self._next_alert *= 2
+        self._alerted = True
+        await self._raise_notice(
+            f"jx3api > ws服务器已连续连接失败 {self._failures} 次，正在持续重连，请查看日志。"
+        )
+
+    async def _supervise(self, first: asyncio.Future):
+        """
+        说明:
+            守护任务，维持ws连接，断开后自动重连
+
+        参数:
+            * `first`：第一次连接的结果
+        """
+        self._failures = 0
+        self._next_alert = max(jx3api_config.ws_alert_failures, 1)
+        while True:
+            connected = await self._connect()
+            if not first.done():
+                first.set_result(connected)
+            if connected:
+                reason = await self._task()
+                logger.error(f"<r>jx3api > ws{reason}，正在重连</r>")
+                self._record(reason)
+                self._reconnects += 1
+            else:
+                await self._check_alert()
+            await asyncio.sleep(self._get_delay())
 
     async def _raise_notice(self, message: str):
         """
@@ -65,71 +219,44 @@ class Jx3WebSocket(object):
         for _, one_bot in bots.items():
             await handle_event(one_bot, event)
 
-    async def _handle_msg(self, message: str):
-        """
-        说明:
-            处理收到的ws数据，分发给机器人
-        """
-        try:
-            ws_obj = json.loads(message)
-            data = WsData.parse_obj(ws_obj)
-            event = EventRister.get_event(data)
-            if event:
-                logger.debug(event.log)
-                bots = get_bots()
-                for _, one_bot in bots.items():
-                    await handle_event(one_bot, event)
-            else:
-                logger.error(f"<r>未知的ws消息类型：{data}</r>")
-        except Exception:
-            logger.error(f"未知ws消息：<g>{ws_obj}</g>")
-
     async def init(self) -> Optional[bool]:
         """
         说明:
-            初始化实例并连接ws服务器
+            启动守护任务连接ws服务器，第一次没连上时在后台继续重连
+
+        返回:
+            * `Optional[bool]`：第一次是否连接成功，已经在连接中返回None，
+            第一次连接完成前被关闭返回False
         """
-        if self.connect or self.is_connecting:
+        if self._supervisor and not self._supervisor.done():
             return None
 
-        ws_path = jx3api_config.ws_path
-        ws_token = jx3api_config.ws_token
-        if ws_token is None:
-            ws_token = ""
-        headers = {"token": ws_token}
-        logger.debug(f"<g>ws_server</g> | 正在链接jx3api的ws服务器：{ws_path}")
-        self.is_connecting = True
-        for i in range(1, 101):
-            try:
-                logger.debug(f"<g>ws_server</g> | 正在开始第 {i} 次尝试")
-                self.connect = await websockets.connect(
-                    uri=ws_path,
-                    extra_headers=headers,
-                    ping_interval=20,
-                    ping_timeout=20,
-                    close_timeout=10,
-                )
-                asyncio.create_task(self._task())
-                logger.debug("<g>ws_server</g> | ws连接成功！")
-                # await self._raise_notice("jx3api > ws已连接！")
-                break
-            except Exception as e:
-                logger.error(f"<r>链接到ws服务器时发生错误：{str(e)}</r>")
-                await asyncio.sleep(1)
-
-        self.is_connecting = False
-        if not self.connect:
-            # 未连接成功，发送消息给bot，如果有
-            self.connect = None
-            await self._raise_notice("jx3api > ws服务器连接失败，请查看日志或者重连。")
-            return False
-        return True
+        logger.debug(f"<g>ws_server</g> | 正在链接jx3api的ws服务器：{jx3api_config.ws_path}")
+        first = asyncio.get_running_loop().create_future()
+        supervisor = asyncio.create_task(self._supervise(first))
+        self._supervisor = supervisor
+        # 守护任务在第一次连接完成前被取消时不会再设置结果，同时等待它结束
+        await asyncio.wait({first, supervisor}, return_when=asyncio.FIRST_COMPLETED)
+        if first.done():
+            return first.result()
+        return False
 
     async def close(self):
-        """关闭ws链接"""
+        """关闭ws链接，不再重连，并通知超级用户"""
+        running = self._supervisor is not None or self.connect is not None
+        if self._supervisor:
+            self._supervisor.cancel()
+            self._supervisor = None
         if self.connect:
             await self.connect.close()
             self.connect = None
+        if self._connected_at:
+            self._uptime += (datetime.now() - self._connected_at).total_seconds()
+            self._connected_at = None
+        if running:
+            self._record("已主动关闭")
+            logger.debug("<g>jx3api > ws链接已主动关闭！</g>")
+            await self._raise_notice("jx3api > ws已正常关闭！")
 
     @property
     def closed(self) -> bool:
@@ -138,6 +265,43 @@ class Jx3WebSocket(object):
             return self.connect.closed
         return True
 
+    @property
+    def is_connecting(self) -> bool:
+        """是否正在重连"""
+        return self._supervisor is not None and self.closed
+
+    def get_status(self) -> dict:
+        """
+        说明:
+            获取连接状态
+
+        返回:
+            * `dict`：连接状态
+                * `connected`：是否已连接
+                * `connecting`：是否正在重连
+                * `uptime`：当前连接已持续的时间，秒
+                * `total_uptime`：累计在线时间，秒
+                * `last_frame`：距离最近收到消息的时间，秒，未连接为None
+                * `failures`：当前连续失败次数
+                * `reconnects`：断线重连次数
+                * `history`：最近的连接记录，(时间, 内容)
+        """
+        uptime = 0.0
+        if self._connected_at:
+            uptime = (datetime.now() - self._connected_at).total_seconds()
+        return {
+            "connected": not self.closed,
+            "connecting": self.is_connecting,
+            "uptime": uptime,
+            "total_uptime": self._uptime + uptime,
+            "last_frame": time.monotonic() - self._last_frame
+            if not self.closed
+            else None,
+            "failures": self._failures,
+            "reconnects": self._reconnects,
+            "history": list(self._history),
+        }
+
 
 ws_client = Jx3WebSocket()
 """
@@ -150,6 +314,7 @@ ws客户端，用于连接jx3api的ws服务器.
 ```
 >>>await ws_client.init() # 初始化
 >>>ws_client.closed # ws是否关闭
+>>>ws_client.get_status() # 连接状态
 >>>await ws_client.close() # 关闭连接
 ```
 """
@@ -1,10 +1,13 @@
 import json
-from typing import Optional
+from typing import Any, Optional
 
 from tortoise import fields
+from tortoise.expressions import F
 from tortoise.models import Model
 
 from src.config import default_config
+from src.internal.database import atomic_update
+from src.internal.write_behind import write_behind
 from src.params import GroupSetting, NoticeType
 
 
@@ -13,6 +16,32 @@ def encode_text(text: str):
     return json.dumps(data, ensure_ascii=False)
 
 
+SETTING_FIELDS: dict[GroupSetting, str] = {
+    GroupSetting.进群通知: "welcome_status",
+    GroupSetting.离群通知: "someoneleft_status",
+    GroupSetting.晚安通知: "goodnight_status",
+    GroupSetting.开服推送: "ws_server",
+    GroupSetting.新闻推送: "ws_news",
+    GroupSetting.奇遇推送: "ws_serendipity",
+    GroupSetting.抓马监控: "ws_horse",
+    GroupSetting.扶摇监控: "ws_fuyao",
+    GroupSetting.奇遇合并: "ws_serendipity_digest",
+}
+"""群设置枚举对应的字段名"""
+
+PUSH_FIELDS = ("ws_server", "ws_news", "ws_serendipity", "ws_horse", "ws_fuyao")
+"""ws推送开关字段"""
+
+CACHED_FIELDS = (
+    "group_name",
+    "server",
+    "robot_status",
+    "robot_active",
+    *SETTING_FIELDS.values(),
+)
+"""缓存在内存中的群设置字段"""
+
+
 class GroupInfo(Model):
     """群信息处理"""
 
@@ -58,11 +87,93 @@ class GroupInfo(Model):
     """ws-抓马推送开关"""
     ws_fuyao = fields.BooleanField(default=True)
     """ws-扶摇推送开关"""
+    ws_serendipity_digest = fields.BooleanField(default=False)
+    """ws-奇遇合并推送开关"""
+
+    _settings: dict[int, dict[str, Any]] = {}
+    """群设置缓存，启动时载入，修改时同步写入"""
+    _push_index: dict[tuple[Optional[str], str], set[int]] = {}
+    """
+    推送订阅索引，键为(服务器, 推送开关字段)，值为订阅的群号集合，只包含机器人开启的群
+
+    服务器为None的键包含所有服务器的群，用于不区分服务器的推送
+    """
 
     class Meta:
         table = "group_info"
         table_description = "管理QQ群信息"
 
+    @classmethod
+    async def load_cache(cls):
+        """
+        说明:
+            从数据库载入所有群设置到内存，启动时使用
+        """
+        records = await cls.all().values("group_id", *CACHED_FIELDS)
+        cls._settings = {record.pop("group_id"): record for record in records}
+        cls._push_index = {}
+        for group_id, settings in cls._settings.items():
+            cls._update_index(group_id, settings, True)
+
+    @classmethod
+    def _update_index(cls, group_id: int, settings: dict[str, Any], add: bool):
+        """
+        说明:
+            把一个群加入或移出推送订阅索引
+
+        参数:
+            * `group_id`：群号
+            * `settings`：该群的缓存设置
+            * `add`：True为加入，False为移出
+        """
+        if not settings["robot_status"]:
+            return
+        for field in PUSH_FIELDS:
+            if not settings[field]:
+                continue
+            for server in (settings["server"], None):
+                group_set = cls._push_index.setdefault((server, field), set())
+                if add:
+                    group_set.add(group_id)
+                else:
+                    group_set.discard(group_id)
+
+    @classmethod
+    def _cache_record(cls, record: "GroupInfo") -> dict[str, Any]:
+        """
+        说明:
+            将一条记录写入缓存
+
+        返回:
+            * `dict[str, Any]`：该群的缓存设置
+        """
+        settings = {field: getattr(record, field) for field in CACHED_FIELDS}
+        old_settings = cls._settings.get(record.group_id)
+        if old_settings:
+            cls._update_index(record.group_id, old_settings, False)
+        cls._settings[record.group_id] = settings
+        cls._update_index(record.group_id, settings, True)
+        return settings
+
+    @classmethod
+    async def _get_settings(cls, group_id: int) -> Optional[dict[str, Any]]:
+        """
+        说明:
+            获取群设置，缓存中没有时从数据库读取
+
+        参数:
+            * `group_id`：群号
+
+        返回:
+            * `Optional[dict[str, Any]]`：群设置，未注册的群为None
+        """
+        settings = cls._settings.get(group_id)
+        if settings is None:
+            record = await cls.get_or_none(group_id=group_id)
+            if record:
+                settings = cls._cache_record(record)
+        return settings
+
     @classmethod
     async def group_init(cls, group_id: int, group_name: str):
         """
@@ -73,9 +184,14 @@ class GroupInfo(Model):
             * `group_id`：群号
             * `group_name`：群名
         """
-        record, _ = await cls.get_or_create(group_id=group_id)
-        record.group_name = group_name
-        await record.save(update_fields=["group_name"])
+        settings = await cls._get_settings(group_id)
+        if settings is None:
+            record = await cls.create(group_id=group_id, group_name=group_name)
+            cls._cache_record(record)
+        elif settings["group_name"] != group_name:
+            # 群名只是展示用，改变了才延迟写入
+            settings["group_name"] = group_name
+            write_behind.update(cls, {"group_id": group_id}, group_name=group_name)
 
     @classmethod
     async def get_bot_status(cls, group_id: int) -> bool:
@@ -89,8 +205,8 @@ class GroupInfo(Model):
         返回:
             * `bool`：机器人是否开启
         """
-        record = await cls.get_or_none(group_id=group_id)
-        return record.robot_status
+        settings = await cls._get_settings(group_id)
+        return settings["robot_status"]
 
     @classmethod
     async def group_sign_in(cls, group_id: int) -> int:
@@ -104,10 +220,14 @@ class GroupInfo(Model):
         返回:
             * `int`：当天已签到数量
         """
-        record, _ = await cls.get_or_create(group_id=group_id)
-        record.sign_nums += 1
-        await record.save(update_fields=["sign_nums"])
-        return record.sign_nums
+        key = {"group_id": group_id}
+        updates = {"sign_nums": F("sign_nums") + 1}
+        data = await atomic_update(cls, key, updates, ("sign_nums",))
+        if data is None:
+            record, _ = await cls.get_or_create(group_id=group_id)
+            cls._cache_record(record)
+            data = await atomic_update(cls, key, updates, ("sign_nums",))
+        return data["sign_nums"]
 
     @classmethod
     async def get_server(cls, group_id: int) -> str:
@@ -121,8 +241,8 @@ class GroupInfo(Model):
         返回:
             * `str`：服务器名
         """
-        record = await cls.get_or_none(group_id=group_id)
-        return record.server
+        settings = await cls._get_settings(group_id)
+        return settings["server"]
 
     @classmethod
     async def get_config_status(cls, group_id: int, setting_type: GroupSetting) -> bool:
@@ -137,25 +257,8 @@ class GroupInfo(Model):
         返回:
             * `bool`：开关状态
         """
-        record = await cls.get_or_none(group_id=group_id)
-        match setting_type:
-            case GroupSetting.进群通知:
-                status = record.welcome_status
-            case GroupSetting.离群通知:
-                status = record.someoneleft_status
-            case GroupSetting.晚安通知:
-                status = record.goodnight_status
-            case GroupSetting.开服推送:
-                status = record.ws_server
-            case GroupSetting.新闻推送:
-                status = record.ws_news
-            case GroupSetting.奇遇推送:
-                status = record.ws_serendipity
-            case GroupSetting.抓马监控:
-                status = record.ws_horse
-            case GroupSetting.扶摇监控:
-                status = record.ws_fuyao
-        return status
+        settings = await cls._get_settings(group_id)
+        return settings[SETTING_FIELDS[setting_type]]
 
     @classmethod
     async def set_config_status(
@@ -170,29 +273,55 @@ class GroupInfo(Model):
             * `setting_type`：群设置枚举
             * `status`：开关状态
         """
+        field = SETTING_FIELDS.get(setting_type)
+        if field is None:
+            return False
         record, _ = await cls.get_or_create(group_id=group_id)
-        match setting_type:
-            case GroupSetting.进群通知:
-                record.welcome_status = status
-            case GroupSetting.离群通知:
-                record.someoneleft_status = status
-            case GroupSetting.晚安通知:
-                record.goodnight_status = status
-            case GroupSetting.开服推送:
-                record.ws_server = status
-            case GroupSetting.新闻推送:
-                record.ws_news = status
-            case GroupSetting.奇遇推送:
-                record.ws_serendipity = status
-            case GroupSetting.抓马监控:
-                record.ws_horse = status
-            case GroupSetting.扶摇监控:
-                record.ws_fuyao = status
-            case _:
-                return False
-        await record.save()
+        setattr(record, field, status)
+        await record.save(update_fields=[field])
+        cls._cache_record(record)
         return True
 
+    @classmethod
+    def get_push_groups(
+        cls, setting_type: GroupSetting, server: Optional[str] = None
+    ) -> list[int]:
+        """
+        说明:
+            从推送订阅索引获取所有打开了某项推送的群，机器人关闭的群不会返回
+
+        参数:
+            * `setting_type`：群设置枚举
+            * `server`：可选，只返回绑定该服务器的群
+
+        返回:
+            * `list[int]`：群号列表
+        """
+        key = (server or None, SETTING_FIELDS[setting_type])
+        return list(cls._push_index.get(key, ()))
+
+    @classmethod
+    def filter_setting_groups(
+        cls, group_list: list[int], setting_type: GroupSetting
+    ) -> list[int]:
+        """
+        说明:
+            从缓存中筛选出打开了某项设置的群
+
+        参数:
+            * `group_list`：群号列表
+            * `setting_type`：群设置枚举
+
+        返回:
+            * `list[int]`：打开了该设置的群号列表
+        """
+        field = SETTING_FIELDS[setting_type]
+        return [
+            group_id
+            for group_id in group_list
+            if cls._settings.get(group_id, {}).get(field)
+        ]
+
     @classmethod
     async def reset_sign_nums(cls):
         """
@@ -214,6 +343,7 @@ class GroupInfo(Model):
         record, _ = await cls.get_or_create(group_id=group_id)
         record.server = server
         await record.save(update_fields=["server"])
+        cls._cache_record(record)
 
     @classmethod
     async def set_activity(cls, group_id: int, activity: int):
@@ -224,6 +354,7 @@ class GroupInfo(Model):
         record, _ = await cls.get_or_create(group_id=group_id)
         record.robot_active = activity
         await record.save(update_fields=["robot_active"])
+        cls._cache_record(record)
 
     @classmethod
     async def set_status(cls, group_id: int, status: bool):
@@ -234,6 +365,7 @@ class GroupInfo(Model):
         record, _ = await cls.get_or_create(group_id=group_id)
         record.robot_status = status
         await record.save(update_fields=["robot_status"])
+        cls._cache_record(record)
 
     @classmethod
     async def get_meau_data(cls, group_id: int) -> dict:
@@ -258,6 +390,7 @@ class GroupInfo(Model):
                 * `ws_serendipity` `bool`：ws奇遇推送开关
                 * `ws_horse` `bool`：ws抓马推送开关
                 * `ws_fuyao` `bool`：ws扶摇推送开关
+                * `ws_serendipity_digest` `bool`：ws奇遇合并推送开关
         """
         record, _ = await cls.get_or_create(group_id=group_id)
         return {
@@ -273,6 +406,7 @@ class GroupInfo(Model):
             "ws_serendipity": record.ws_serendipity,
             "ws_horse": record.ws_horse,
             "ws_fuyao": record.ws_fuyao,
+            "ws_serendipity_digest": record.ws_serendipity_digest,
         }
 
     @classmethod
@@ -331,13 +465,23 @@ class GroupInfo(Model):
         参数:
             * `group_id`：群号
         """
+        await write_behind.discard(cls, group_id=group_id)
         await cls.filter(group_id=group_id).delete()
+        settings = cls._settings.pop(group_id, None)
+        if settings:
+            cls._update_index(group_id, settings, False)
 
     @classmethod
-    async def get_group_list(cls) -> list[dict]:
+    async def get_group_list(
+        cls, offset: int = 0, limit: Optional[int] = None
+    ) -> list[dict]:
         """
         说明:
-            获取群列表数据
+            获取群列表数据，按群号排序，可以分页获取
+
+        参数:
+            * `offset`：跳过的群数量
+            * `limit`：获取的群数量，默认全部
 
         返回:
             * `list[dict]`：群信息列表
@@ -348,7 +492,10 @@ class GroupInfo(Model):
                 * `robot_status` `bool`：机器人总开关
                 * `robot_active` `int`：机器人活跃度
         """
-        return await cls.all().values(
+        query = cls.all().order_by("group_id").offset(offset)
+        if limit is not None:
+            query = query.limit(limit)
+        return await query.values(
             "group_id",
             "group_name",
             "sign_nums",
@@ -357,6 +504,32 @@ class GroupInfo(Model):
             "robot_active",
         )
 
+    @classmethod
+    def get_bound_servers(cls) -> set[str]:
+        """
+        说明:
+            获取开启机器人的群绑定的所有服务器，从缓存读取
+
+        返回:
+            * `set[str]`：服务器名集合
+        """
+        return {
+            settings["server"]
+            for settings in cls._settings.values()
+            if settings["robot_status"] and settings["server"]
+        }
+
+    @classmethod
+    async def get_group_count(cls) -> int:
+        """
+        说明:
+            获取注册的群数量
+
+        返回:
+            * `int`：群数量
+        """
+        return await cls.all().count()
+
     @classmethod
     async def get_group_name(cls, group_id: int) -> Optional[str]:
         """
@@ -386,5 +559,8 @@ class GroupInfo(Model):
         返回:
             * `int`：活跃值，1-99
         """
-        record, _ = await cls.get_or_create(group_id=group_id)
-        return record.robot_active
+        settings = await cls._get_settings(group_id)
+        if settings is None:
+            record = await cls.create(group_id=group_id)
+            settings = cls._cache_record(record)
+        return settings["robot_active"]
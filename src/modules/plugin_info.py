@@ -15,10 +15,27 @@ class PluginInfo(Model):
     status = fields.BooleanField(default=False)
     """插件状态"""
 
+    _status: dict[tuple[int, str], bool] = {}
+    """插件开关缓存，键为(群号, 模块名)，启动时载入，修改时同步写入"""
+    _cache_loaded: bool = False
+    """缓存是否已载入"""
+
     class Meta:
         table = "plugin_info"
         table_description = "用来记录插件开关"
 
+    @classmethod
+    async def load_cache(cls):
+        """
+        说明:
+            从数据库载入所有插件开关到内存，启动时使用
+        """
+        records = await cls.all().values_list("group_id", "module_name", "status")
+        cls._status = {
+            (group_id, module_name): status for group_id, module_name, status in records
+        }
+        cls._cache_loaded = True
+
     @classmethod
     async def check_inited(cls, group_id: int, module_name: str) -> bool:
         """
@@ -32,8 +49,7 @@ class PluginInfo(Model):
         返回:
             * `bool`：是否注册该插件
         """
-        record = await cls.get_or_none(group_id=group_id, module_name=module_name)
-        return record is not None
+        return await cls.get_plugin_status(group_id, module_name) is not None
 
     @classmethod
     async def init_plugin(
@@ -51,6 +67,7 @@ class PluginInfo(Model):
             module_name=module_name,
             status=status,
         )
+        cls._status[(group_id, module_name)] = status
 
     @classmethod
     async def get_plugin_status(cls, group_id: int, module_name: str) -> Optional[bool]:
@@ -65,6 +82,8 @@ class PluginInfo(Model):
         返回:
             * `Optional[bool]`：插件开关，为None时未找到该插件
         """
+        if cls._cache_loaded:
+            return cls._status.get((group_id, module_name))
         record = await cls.get_or_none(group_id=group_id, module_name=module_name)
         return record.status if record else None
 
@@ -87,7 +106,8 @@ class PluginInfo(Model):
         record = await cls.get_or_none(group_id=group_id, module_name=module_name)
         if record:
             record.status = status
-            await record.save()
+            await record.save(update_fields=["status"])
+            cls._status[(group_id, module_name)] = status
             return True
         return False
 
@@ -121,3 +141,5 @@ class PluginInfo(Model):
             * `group_id`：群号
         """
         await cls.filter(group_id=group_id).delete()
+        for key in [key for key in cls._status if key[0] == group_id]:
+            del cls._status[key]
@@ -3,6 +3,8 @@ import time
 from tortoise import fields
 from tortoise.models import Model
 
+from src.internal.write_behind import write_behind
+
 
 class SearchRecord(Model):
     """查询使用记录表"""
@@ -17,10 +19,24 @@ class SearchRecord(Model):
     last_time = fields.IntField(default=0)
     """上次查询时间"""
 
+    _last_time: dict[tuple[int, str], int] = {}
+    """上次查询时间缓存，键为(群号, app名称)"""
+
     class Meta:
         table = "search_record"
         table_description = "记录查询次数"
 
+    @classmethod
+    async def load_cache(cls):
+        """
+        说明:
+            从数据库载入查询时间缓存，冷却判断不再读数据库
+        """
+        records = await cls.all().values_list("group_id", "app_name", "last_time")
+        cls._last_time = {
+            (group_id, app_name): last_time for group_id, app_name, last_time in records
+        }
+
     @classmethod
     async def get_search_time(cls, group_id: int, app_name: str) -> int:
         """
@@ -34,24 +50,26 @@ class SearchRecord(Model):
         返回:
             * `int`：上次查询时间戳
         """
-        record, _ = await cls.get_or_create(group_id=group_id, app_name=app_name)
-        return record.last_time
+        return cls._last_time.get((group_id, app_name), 0)
 
     @classmethod
     async def use_search(cls, group_id: int, app_name: str):
         """
         说明:
-            使用一次查询
+            使用一次查询，第一次使用时新建记录，之后只记录在内存中，
+            由延迟写入队列批量写入数据库
 
         参数:
             * `group_id`：群号
             * `app_name`：app名称
         """
-        record, _ = await cls.get_or_create(group_id=group_id, app_name=app_name)
+        if (group_id, app_name) not in cls._last_time:
+            await cls.get_or_create(group_id=group_id, app_name=app_name)
         time_now = int(time.time())
-        record.last_time = time_now
-        record.count += 1
-        await record.save()
+        cls._last_time[(group_id, app_name)] = time_now
+        key = {"group_id": group_id, "app_name": app_name}
+        write_behind.increment(cls, key, "count")
+        write_behind.update(cls, key, last_time=time_now)
 
     @classmethod
     async def delete_group(cls, group_id: int):
@@ -62,4 +80,7 @@ class SearchRecord(Model):
         参数:
             * `group_id`：群号
         """
+        for key in [key for key in cls._last_time if key[0] == group_id]:
+            cls._last_time.pop(key)
+        await write_behind.discard(cls, group_id=group_id)
         await cls.filter(group_id=group_id).delete()
@@ -1,8 +1,13 @@
 import random
 from datetime import date
+from typing import Optional
 
 from tortoise import fields
+from tortoise.expressions import F
 from tortoise.models import Model
+from tortoise.transactions import in_transaction
+
+from src.internal.database import atomic_update
 
 
 class UserInfo(Model):
@@ -31,19 +36,40 @@ class UserInfo(Model):
         table_description = "管理用户"
 
     @classmethod
-    async def user_init(cls, user_id: int, group_id: int, user_name: str):
+    async def sync_members(cls, group_id: int, members: dict[int, str]):
         """
         说明:
-            注册一个用户并刷新昵称
+            批量注册一个群的成员并刷新昵称，对比已有记录，
+            只新建缺少的用户和更新改了昵称的用户，在一个事务内完成
 
         参数:
-            * `user_id`: 用户QQ号
             * `group_id`：群号
-            * `user_name`：用户昵称
+            * `members`：成员字典，键为用户QQ号，值为用户昵称
         """
-        record, _ = await cls.get_or_create(user_id=user_id, group_id=group_id)
-        record.user_name = user_name
-        await record.save()
+        async with in_transaction() as connection:
+            records = await cls.filter(group_id=group_id).using_db(connection)
+            exist_users = set()
+            update_list = []
+            for record in records:
+                exist_users.add(record.user_id)
+                user_name = members.get(record.user_id)
+                if user_name is not None and user_name != record.user_name:
+                    record.user_name = user_name
+                    update_list.append(record)
+            create_list = [
+                cls(user_id=user_id, group_id=group_id, user_name=user_name)
+                for user_id, user_name in members.items()
+                if user_id not in exist_users
+            ]
+            if create_list:
+                await cls.bulk_create(create_list, batch_size=500, using_db=connection)
+            if update_list:
+                await cls.bulk_update(
+                    update_list,
+                    fields=["user_name"],
+                    batch_size=500,
+                    using_db=connection,
+                )
 
     @classmethod
     async def sign_in(
@@ -55,10 +81,10 @@ class UserInfo(Model):
         friendly_add: int,
         gold_base: int,
         lucky_gold: int,
-    ) -> dict[str, int]:
+    ) -> Optional[dict[str, int]]:
         """
         说明:
-            设置签到
+            设置签到，今天已经签到过则返回None
 
         参数:
             * `user_id`：用户QQ
@@ -70,36 +96,45 @@ class UserInfo(Model):
             * `lucky_gold`：幸运值影响因子
 
         返回:
-            * `dict[str,int]`：返回数据字典
+            * `Optional[dict[str,int]]`：返回数据字典，已签到为None
                 * `today_lucky`：今日运势
                 * `today_gold`：今日金币
                 * `all_gold`：总金币
                 * `all_friendly`：好友度
                 * `sign_times`：签到次数
         """
-        record, _ = await cls.get_or_create(user_id=user_id, group_id=group_id)
-        # 设置签到日期
         today = date.today()
-        record.last_sign = today
         # 计算运势
         today_lucky = random.randint(lucky_min, lucky_max)
-        record.lucky = today_lucky
         # 计算金币
         today_gold = gold_base + lucky_gold * today_lucky
-        record.gold += today_gold
-        all_gold = record.gold
         # 计算好友度
         today_friendy = today_lucky * friendly_add
-        record.friendly += today_friendy
-        # 累计签到次数
-        record.sign_times += 1
-        await record.save()
+        key = {"user_id": user_id, "group_id": group_id}
+        updates = {
+            "last_sign": today,
+            "lucky": today_lucky,
+            "gold": F("gold") + today_gold,
+            "friendly": F("friendly") + today_friendy,
+            "sign_times": F("sign_times") + 1,
+        }
+        returning = ("gold", "friendly", "sign_times")
+        # 只有今天没签到过的记录才会更新，并发签到只有一次成功
+        condition = {"last_sign__not": today}
+        data = await atomic_update(cls, key, updates, returning, condition)
+        if data is None:
+            _, created = await cls.get_or_create(**key)
+            if not created:
+                return None
+            data = await atomic_update(cls, key, updates, returning, condition)
+            if data is None:
+                return None
         return {
             "today_lucky": today_lucky,
             "today_gold": today_gold,
-            "all_gold": all_gold,
-            "all_friendly": record.friendly,
-            "sign_times": record.sign_times,
+            "all_gold": data["gold"],
+            "all_friendly": data["friendly"],
+            "sign_times": data["sign_times"],
         }
 
     @classmethod
@@ -157,12 +192,13 @@ class UserInfo(Model):
         返回:
             * `bool`：是否使用成功
         """
-        record, _ = await cls.get_or_create(user_id=user_id, group_id=group_id)
-        if record.gold >= gold:
-            record.gold -= gold
-            await record.save()
+        if gold <= 0:
             return True
-        return False
+        # 金币足够时才扣除，判断和扣除在一条语句内完成
+        count = await cls.filter(
+            user_id=user_id, group_id=group_id, gold__gte=gold
+        ).update(gold=F("gold") - gold)
+        return count > 0
 
     @classmethod
     async def get_user_data(cls, user_id: int, group_id: int) -> dict[str, int]:
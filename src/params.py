@@ -83,6 +83,7 @@ class GroupSetting(Enum):
     奇遇推送 = auto()
     抓马监控 = auto()
     扶摇监控 = auto()
+    奇遇合并 = auto()
 
 
 class NoticeType(Enum):
@@ -1,5 +1,6 @@
+import asyncio
 import time
-from datetime import datetime
+from datetime import datetime, timedelta
 from enum import Enum
 from typing import Optional
 
@@ -16,9 +17,11 @@ from src.modules.ticket_info import TicketInfo
 from src.params import PluginConfig
 from src.utils.browser import browser
 from src.utils.log import logger
+from src.utils.scheduler import scheduler
 
 from . import data_source as source
 from .config import DAILIY_LIST, JX3PROFESSION
+from .update_notice import update_notice
 
 __plugin_meta__ = PluginMetadata(
     name="剑三查询", description="剑三游戏查询，数据源使用jx3api", usage="参考“帮助”", config=PluginConfig()
@@ -27,6 +30,17 @@ __plugin_meta__ = PluginMetadata(
 api = JX3API()
 """jx3api接口实例"""
 
+WARM_APIS: dict[str, int] = {
+    "app_daily": 14400,
+    "app_demon": 600,
+}
+"""
+高峰前预热的接口和预热数据的缓存时间，秒：日常当天不变，缓存到高峰结束；
+金价变化快，只在高峰前几分钟预热。开服状态缓存只有30秒，预热没有意义
+"""
+WARM_CONCURRENCY = 5
+"""预热时同时进行的请求数"""
+
 # ----------------------------------------------------------------
 #   正则枚举，已实现的查询功能
 # ----------------------------------------------------------------
@@ -309,7 +323,8 @@ def get_camp():
 def cold_down(name: str, cd_time: int) -> None:
     """
     说明:
-        Dependency，增加命令冷却，同时会在数据库中记录一次查询
+        Dependency，增加命令冷却，同时记录一次查询，冷却时间在内存中判断，
+        查询次数由延迟写入队列批量写入数据库
 
     参数:
         * `name`：app名称，相同名称会使用同一组cd
@@ -324,15 +339,13 @@ def cold_down(name: str, cd_time: int) -> None:
     """
 
     async def dependency(matcher: Matcher, event: GroupMessageEvent):
-        time_last = await SearchRecord.get_search_time(event.group_id, name)
-        time_now = int(time.time())
-        over_time = over_time = time_now - time_last
-        if over_time > cd_time:
-            await SearchRecord.use_search(event.group_id, name)
-            return
-        else:
-            left_cd = cd_time - over_time
-            await matcher.finish(f"[{name}]冷却中 ({left_cd})")
+        if cd_time > 0:
+            time_last = await SearchRecord.get_search_time(event.group_id, name)
+            over_time = int(time.time()) - time_last
+            if over_time <= cd_time:
+                left_cd = cd_time - over_time
+                await matcher.finish(f"[{name}]冷却中 ({left_cd})")
+        await SearchRecord.use_search(event.group_id, name)
 
     return Depends(dependency)
 
@@ -524,8 +537,9 @@ async def _(event: GroupMessageEvent, name: str = Depends(get_value)):
 async def _(event: GroupMessageEvent):
     """更新公告"""
     logger.info(f"<y>群{event.group_id}</y> | <g>{event.user_id}</g> | 更新公告查询")
-    url = "https://jx3.xoyo.com/launcher/update/latest.html"
-    img = await browser.get_image_from_url(url=url, width=130, height=480)
+    img = await update_notice.get_image()
+    if img is None:
+        await update_query.finish("获取更新公告失败了，请稍后再试~")
     msg = MessageSegment.image(img)
     log = f"群{event.group_id} | 查询更新公告"
     logger.info(log)
@@ -862,3 +876,36 @@ async def _(event: GroupMessageEvent):
     pagename = "查询帮助.html"
     img = await browser.template_to_image(pagename=pagename, flag=flag)
     await help.finish(MessageSegment.image(img))
+
+
+@scheduler.scheduled_job(
+    "interval", minutes=10, next_run_time=datetime.now() + timedelta(seconds=30)
+)
+async def _():
+    """定时检查更新公告，公告变化时重新截图"""
+    await update_notice.refresh()
+
+
+@scheduler.scheduled_job("cron", hour=7, minute=1)
+@scheduler.scheduled_job("cron", hour=19, minute=58)
+async def _():
+    """日常刷新后和晚上活动前，预热所有绑定服务器的日常、金价数据"""
+    servers = GroupInfo.get_bound_servers()
+    semaphore = asyncio.Semaphore(WARM_CONCURRENCY)
+
+    async def warm(name: str, ttl: int, server: str) -> bool:
+        async with semaphore:
+            return await api.prefetch(name, ttl=ttl, server=server)
+
+    time_start = time.monotonic()
+    results = await asyncio.gather(
+        *(
+            warm(name, ttl, server)
+            for server in servers
+            for name, ttl in WARM_APIS.items()
+        )
+    )
+    cost = time.monotonic() - time_start
+    logger.info(
+        f"数据预热 | {len(servers)}个服务器 | 成功{sum(results)}/{len(results)} | 用时{cost:.2f}秒"
+    )
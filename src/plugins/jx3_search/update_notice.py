@@ -0,0 +1,111 @@
+import asyncio
+import hashlib
+from pathlib import Path
+from typing import Optional
+
+from httpx import AsyncClient
+from nonebot.utils import run_sync
+
+from src.config import path_config
+from src.utils.browser import browser
+from src.utils.log import logger
+
+UPDATE_URL = "https://jx3.xoyo.com/launcher/update/latest.html"
+"""更新公告地址"""
+
+
+class UpdateNotice:
+    """
+    更新公告截图缓存，定时检查公告页面内容，内容变化时才重新截图
+
+    截图和页面哈希保存在data目录，重启后直接使用。
+    """
+
+    _client: AsyncClient
+    """请求客户端"""
+    _image_file: Path
+    """截图文件"""
+    _hash_file: Path
+    """页面哈希文件"""
+    _hash: Optional[str]
+    """当前截图对应的页面哈希"""
+    _image: Optional[bytes]
+    """当前截图"""
+    _lock: asyncio.Lock
+    """刷新锁，同时只有一次刷新"""
+
+    def __init__(self):
+        self._client = AsyncClient(timeout=10, follow_redirects=True)
+        data_path = Path(path_config.data)
+        self._image_file = data_path / "update_notice.jpg"
+        self._hash_file = data_path / "update_notice.hash"
+        self._hash = None
+        self._image = None
+        self._lock = asyncio.Lock()
+
+    @run_sync
+    def _load(self):
+        """从data目录载入上次的截图"""
+        if self._image_file.is_file() and self._hash_file.is_file():
+            self._image = self._image_file.read_bytes()
+            self._hash = self._hash_file.read_text()
+
+    @run_sync
+    def _save(self):
+        """把截图保存到data目录"""
+        self._image_file.write_bytes(self._image)
+        self._hash_file.write_text(self._hash)
+
+    async def refresh(self) -> bool:
+        """
+        说明:
+            检查公告页面，内容变化时重新截图
+
+        返回:
+            * `bool`：是否重新截图
+        """
+        async with self._lock:
+            if self._image is None:
+                await self._load()
+            try:
+                resp = await self._client.get(UPDATE_URL)
+                resp.raise_for_status()
+            except Exception as e:
+                logger.debug(f"更新公告 | 页面请求失败：{str(e)}")
+                return False
+            page_hash = hashlib.sha256(resp.content).hexdigest()
+            if page_hash == self._hash and self._image is not None:
+                return False
+            try:
+                image = await browser.get_image_from_url(
+                    url=UPDATE_URL, width=130, height=480
+                )
+            except Exception as e:
+                logger.error(f"<r>更新公告</r> | 截图失败：{str(e)}")
+                return False
+            self._image, self._hash = image, page_hash
+            await self._save()
+            logger.info("更新公告 | 公告已变化，截图已更新")
+            return True
+
+    async def get_image(self) -> Optional[bytes]:
+        """
+        说明:
+            获取更新公告截图，还没有截图时先刷新
+
+        返回:
+            * `Optional[bytes]`：截图，获取失败为None
+        """
+        if self._image is None:
+            await self.refresh()
+        return self._image
+
+
+update_notice = UpdateNotice()
+"""
+更新公告截图缓存，使用方法：
+```
+>>>await update_notice.refresh() # 检查并刷新截图
+>>>await update_notice.get_image() # 获取截图
+```
+"""
@@ -36,14 +36,7 @@ async def get_sign_in(user_id: int, group_id: int) -> Message:
         msg += MessageSegment.text("\n你今天已经签到了，不要贪心噢。")
         return msg
 
-    # 头像
-    qq_head = await _get_qq_img(user_id)
-    msg_head = MessageSegment.image(qq_head)
-
-    # 签到名次
-    sign_num = await GroupInfo.group_sign_in(group_id)
-
-    # 设置签到
+    # 设置签到，并发签到时只有一次成功
     data = await UserInfo.sign_in(
         user_id=user_id,
         group_id=group_id,
@@ -53,6 +46,17 @@ async def get_sign_in(user_id: int, group_id: int) -> Message:
         gold_base=GOLD_BASE,
         lucky_gold=LUCKY_GOLD,
     )
+    if data is None:
+        logger.debug(f"<y>群{group_id}</y> | <g>{user_id}</g> | 签到失败")
+        msg += MessageSegment.text("\n你今天已经签到了，不要贪心噢。")
+        return msg
+
+    # 签到名次
+    sign_num = await GroupInfo.group_sign_in(group_id)
+
+    # 头像
+    qq_head = await _get_qq_img(user_id)
+    msg_head = MessageSegment.image(qq_head)
 
     msg_txt = f"本群第 {sign_num} 位 签到完成\n"
     msg_txt += f'今日运势：{data.get("today_lucky")}\n'
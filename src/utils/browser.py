@@ -1,26 +1,946 @@
+import asyncio
+import hashlib
+import heapq
+import io
+import json
+import mimetypes
+import time
 from contextlib import asynccontextmanager
 from pathlib import Path
-from typing import AsyncIterator, Optional
+from typing import (
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    NamedTuple,
+    Optional,
+    TypeVar,
+    Union,
+)
+from urllib.parse import unquote, urlsplit
 
 import jinja2
-from playwright.async_api import Browser, Error, Page, async_playwright
+from httpx import AsyncClient
+from nonebot import get_driver
+from nonebot.matcher import current_event
+from nonebot.utils import run_sync
+from playwright.async_api import (
+    Browser,
+    ElementHandle,
+    Error,
+    Page,
+    Route,
+    async_playwright,
+)
 
-from src.config import path_config
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
 
+from src.config import browser_config, path_config
+
+from .cache import TTLCache
 from .log import logger
 
+RENDER_CACHE_TTL: dict[str, int] = {
+    "查询帮助.html": 86400,
+    "管理员帮助.html": 86400,
+    "超级用户帮助.html": 86400,
+    "个人排行.html": 600,
+    "帮会排行.html": 600,
+    "试炼排行.html": 600,
+    "资历排行.html": 600,
+    "奇遇汇总.html": 300,
+    "好友列表.html": 0,
+    "群列表.html": 0,
+}
+"""单独设置缓存时间的模板，秒，其他模板使用配置的默认缓存时间"""
+
+IMAGE_QUALITY: dict[str, int] = {
+    "好友列表.html": 70,
+    "群列表.html": 70,
+    "查询帮助.html": 90,
+    "管理员帮助.html": 90,
+    "超级用户帮助.html": 90,
+}
+"""单独设置图片质量的模板，其他模板使用配置的默认质量"""
+
+IMAGE_FORMATS = ("jpeg", "png", "webp")
+"""支持的图片格式"""
+
+
+class ImageOptions(NamedTuple):
+    """图片输出设置"""
+
+    format: str
+    """图片格式，jpeg/png/webp"""
+    quality: int
+    """图片质量，1-100，png无效"""
+    max_width: int
+    """最大宽度，超过时等比缩小，0为不限制"""
+
+    @property
+    def suffix(self) -> str:
+        """实际输出图片的后缀，没有Pillow时webp会输出为jpeg"""
+        if self.format == "png":
+            return "png"
+        if self.format == "webp" and Image is not None:
+            return "webp"
+        return "jpg"
+
+
+def get_image_options(pagename: Optional[str] = None) -> ImageOptions:
+    """
+    说明:
+        获取模板的图片输出设置
+
+    参数:
+        * `pagename`：模板文件名，None为使用默认设置
+
+    返回:
+        * `ImageOptions`：图片输出设置
+    """
+    image_format = browser_config.image_format.lower()
+    if image_format not in IMAGE_FORMATS:
+        image_format = "jpeg"
+    quality = IMAGE_QUALITY.get(pagename, browser_config.image_quality)
+    return ImageOptions(image_format, quality, browser_config.image_max_width)
+
+
+def _need_pillow(options: ImageOptions) -> bool:
+    """浏览器只能输出jpeg和png，转webp和缩放需要使用Pillow"""
+    return options.format == "webp" or options.max_width > 0
+
+
+@run_sync
+def _encode_image(raw: bytes, options: ImageOptions) -> bytes:
+    """
+    说明:
+        使用Pillow缩放并重新编码截图
+
+    参数:
+        * `raw`：png格式的截图
+        * `options`：图片输出设置
+
+    返回:
+        * `bytes`：编码后的图片
+    """
+    image = Image.open(io.BytesIO(raw))
+    if options.max_width and image.width > options.max_width:
+        height = round(image.height * options.max_width / image.width)
+        image = image.resize((options.max_width, height), Image.LANCZOS)
+    output = io.BytesIO()
+    if options.format == "png":
+        image.save(output, format="PNG", optimize=True)
+    else:
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+        image.save(output, format=options.format.upper(), quality=options.quality)
+    return output.getvalue()
+
+
+TEMPLATE_ORIGIN = "http://template.local/"
+"""模板页面使用的虚拟地址，该地址下的请求都由本地模板目录响应"""
+
+ASSET_RESOURCE_TYPES = ("image", "font", "stylesheet")
+"""会缓存到本地的远程资源类型"""
+
+_WARM_HTML = (
+    '<link rel="stylesheet" href="css/bootstrap.min.css">'
+    '<link rel="stylesheet" href="css/table.css">'
+)
+"""预热页面时载入的公共css"""
+
+
+T = TypeVar("T")
+
+PRIORITY_HIGH = 0
+"""超级用户和群管理的渲染优先级"""
+PRIORITY_NORMAL = 1
+"""普通用户的渲染优先级"""
+
+
+class RenderError(Exception):
+    """渲染调度异常，需要给用户回复友好提示"""
+
+    message: str
+    """回复给用户的提示"""
+
+    def __init__(self, message: str):
+        super().__init__(message)
+        self.message = message
+
+
+class RenderBusyError(RenderError):
+    """渲染队列已满"""
+
+    def __init__(self):
+        super().__init__("当前查询的人太多了，请稍后再试~")
+
+
+class RenderTimeoutError(RenderError):
+    """渲染超时"""
+
+    def __init__(self):
+        super().__init__("图片生成超时了，请稍后再试~")
+
+
+def get_render_priority() -> int:
+    """
+    说明:
+        根据当前处理的事件获取渲染优先级，超级用户和群管理优先渲染
+
+    返回:
+        * `int`：优先级，数字越小越优先
+    """
+    try:
+        event = current_event.get()
+        user_id = event.get_user_id()
+    except (LookupError, ValueError):
+        return PRIORITY_NORMAL
+    if user_id in get_driver().config.superusers:
+        return PRIORITY_HIGH
+    sender = getattr(event, "sender", None)
+    if getattr(sender, "role", None) in ("owner", "admin"):
+        return PRIORITY_HIGH
+    return PRIORITY_NORMAL
+
+
+class RenderScheduler:
+    """
+    渲染调度器，限制同时渲染的任务数，超出的任务按优先级排队
+
+    队列满时直接拒绝，单个任务超时会被取消，防止突发请求打开过多页面。
+    """
+
+    _max_concurrency: int
+    """同时渲染的任务数"""
+    _max_queue: int
+    """排队任务上限"""
+    _timeout: float
+    """单个任务超时时间，秒"""
+    _running: int
+    """正在渲染的任务数"""
+    _queue: list[tuple[int, int, asyncio.Future]]
+    """排队中的任务，(优先级, 序号, 唤醒用的future)组成的堆"""
+    _seq: int
+    """入队序号，同优先级先来先得"""
+    _stats: dict[str, float]
+    """调度统计"""
+
+    def __init__(self, max_concurrency: int, max_queue: int, timeout: float):
+        self._max_concurrency = max(max_concurrency, 1)
+        self._max_queue = max(max_queue, 0)
+        self._timeout = timeout
+        self._running = 0
+        self._queue = []
+        self._seq = 0
+        self._stats = {
+            "jobs": 0,
+            "queued": 0,
+            "rejected": 0,
+            "timeouts": 0,
+            "wait_sum": 0.0,
+            "wait_max": 0.0,
+        }
+
+    async def _acquire(self, priority: int):
+        """
+        说明:
+            获取一个渲染名额，没有空闲名额时排队等待
+        """
+        if self._running < self._max_concurrency and not self._queue:
+            self._running += 1
+            return
+        if len(self._queue) >= self._max_queue:
+            self._stats["rejected"] += 1
+            raise RenderBusyError()
+        future = asyncio.get_running_loop().create_future()
+        self._seq += 1
+        entry = (priority, self._seq, future)
+        heapq.heappush(self._queue, entry)
+        self._stats["queued"] += 1
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # 名额已经交接给了这个任务，转交给下一个
+                self._release()
+            elif entry in self._queue:
+                # 还在排队时被取消，移出队列，不再占用排队名额
+                self._queue.remove(entry)
+                heapq.heapify(self._queue)
+            raise
+
+    def _release(self):
+        """
+        说明:
+            归还渲染名额，有排队任务时直接交接给优先级最高的任务
+        """
+        while self._queue:
+            _, _, future = heapq.heappop(self._queue)
+            if not future.done():
+                future.set_result(None)
+                return
+        self._running -= 1
+
+    async def run(self, job: Callable[[], Awaitable[T]]) -> T:
+        """
+        说明:
+            调度一个渲染任务，优先级根据当前事件判断
+
+        参数:
+            * `job`：返回渲染协程的函数
+
+        返回:
+            * 渲染结果
+
+        异常:
+            * `RenderBusyError`：队列已满
+            * `RenderTimeoutError`：渲染超时
+        """
+        time_start = time.monotonic()
+        await self._acquire(get_render_priority())
+        wait = time.monotonic() - time_start
+        self._stats["jobs"] += 1
+        self._stats["wait_sum"] += wait
+        self._stats["wait_max"] = max(self._stats["wait_max"], wait)
+        try:
+            return await asyncio.wait_for(job(), timeout=self._timeout)
+        except asyncio.TimeoutError:
+            self._stats["timeouts"] += 1
+            raise RenderTimeoutError()
+        finally:
+            self._release()
+
+    def get_stats(self) -> dict[str, float]:
+        """
+        说明:
+            获取调度统计
+
+        返回:
+            * `dict[str, float]`：统计数据
+                * `running`：正在渲染的任务数
+                * `depth`：排队中的任务数
+                * `jobs`：已开始渲染的任务数
+                * `queued`：排过队的任务数
+                * `rejected`：被拒绝的任务数
+                * `timeouts`：超时的任务数
+                * `wait_avg`：平均排队时间，秒
+                * `wait_max`：最长排队时间，秒
+        """
+        jobs = self._stats["jobs"]
+        return {
+            "running": self._running,
+            "depth": len(self._queue),
+            "jobs": jobs,
+            "queued": self._stats["queued"],
+            "rejected": self._stats["rejected"],
+            "timeouts": self._stats["timeouts"],
+            "wait_avg": self._stats["wait_sum"] / jobs if jobs else 0.0,
+            "wait_max": self._stats["wait_max"],
+        }
+
+
+class AssetStore:
+    """
+    页面资源仓库，通过playwright请求拦截响应页面中的资源请求
+
+    模板目录下的css、字体、图片从内存响应，远程图标和图片第一次下载后缓存到磁盘和内存，
+    之后直接从本地响应，渲染不再等待外部网络。
+    """
+
+    _template_path: Path
+    """模板目录"""
+    _disk_path: Path
+    """远程资源磁盘缓存目录"""
+    _max_age: int
+    """远程资源磁盘缓存时间，秒"""
+    _local: dict[str, tuple[bytes, str]]
+    """模板目录资源缓存，键为相对路径，值为(数据, 类型)"""
+    _remote: TTLCache
+    """远程资源内存缓存，值为(数据, 类型)"""
+    _inflight: dict[str, asyncio.Task]
+    """正在下载的远程资源，同一地址只下载一次"""
+    _client: AsyncClient
+    """下载远程资源的客户端"""
+
+    def __init__(
+        self, template_path: Path, disk_path: Path, max_bytes: int, max_age: int
+    ):
+        self._template_path = template_path.resolve()
+        self._disk_path = disk_path
+        self._disk_path.mkdir(parents=True, exist_ok=True)
+        self._max_age = max_age
+        self._local = {}
+        self._remote = TTLCache(max_size=max_bytes, sizeof=lambda item: len(item[0]))
+        self._inflight = {}
+        self._client = AsyncClient(timeout=10, follow_redirects=True)
+
+    @staticmethod
+    def _guess_type(path: str) -> str:
+        """根据路径猜测资源类型"""
+        return mimetypes.guess_type(path)[0] or "application/octet-stream"
+
+    @run_sync
+    def _read_local(self, path: str) -> Optional[bytes]:
+        """读取模板目录下的文件，不允许访问模板目录外的文件"""
+        file_name = (self._template_path / path).resolve()
+        if self._template_path not in file_name.parents or not file_name.is_file():
+            return None
+        return file_name.read_bytes()
+
+    async def _get_local(self, path: str) -> Optional[tuple[bytes, str]]:
+        """
+        说明:
+            获取模板目录下的资源，第一次读取后常驻内存
+        """
+        item = self._local.get(path)
+        if item is None:
+            body = await self._read_local(path)
+            if body is None:
+                return None
+            item = (body, self._guess_type(path))
+            self._local[path] = item
+        return item
+
+    @run_sync
+    def _load_disk(self, file_name: Path) -> Optional[bytes]:
+        """读取磁盘缓存，过期返回None"""
+        try:
+            if time.time() - file_name.stat().st_mtime > self._max_age:
+                return None
+        except FileNotFoundError:
+            return None
+        return file_name.read_bytes()
+
+    @run_sync
+    def _save_disk(self, file_name: Path, body: bytes):
+        """写入磁盘缓存"""
+        file_name.write_bytes(body)
+
+    async def _download(self, url: str) -> Optional[tuple[bytes, str]]:
+        """
+        说明:
+            获取远程资源，依次查找磁盘缓存和下载
+        """
+        file_name = self._disk_path / hashlib.sha256(url.encode("utf-8")).hexdigest()
+        body = await self._load_disk(file_name)
+        if body is not None:
+            return body, self._guess_type(urlsplit(url).path)
+        try:
+            resp = await self._client.get(url)
+        except Exception as e:
+            logger.debug(f"资源下载失败 | {url} | {str(e)}")
+            return None
+        if resp.status_code != 200:
+            return None
+        content_type = resp.headers.get("content-type") or self._guess_type(
+            urlsplit(url).path
+        )
+        await self._save_disk(file_name, resp.content)
+        return resp.content, content_type
+
+    async def _get_remote(self, url: str) -> Optional[tuple[bytes, str]]:
+        """
+        说明:
+            获取远程资源，内存中没有时下载，同一地址同时只下载一次
+        """
+        item = self._remote.get(url)
+        if item is not None:
+            return item
+        task = self._inflight.get(url)
+        if task is None:
+            task = asyncio.create_task(self._download(url))
+            self._inflight[url] = task
+            task.add_done_callback(lambda _: self._inflight.pop(url, None))
+        item = await asyncio.shield(task)
+        if item is not None:
+            self._remote.set(url, item, self._max_age)
+        return item
+
+    async def handle(self, route: Route):
+        """
+        说明:
+            请求拦截处理，模板目录和可缓存的远程资源从本地响应，其他请求正常放行
+        """
+        request = route.request
+        url = request.url
+        if url.startswith(TEMPLATE_ORIGIN):
+            path = unquote(urlsplit(url).path).lstrip("/")
+            if not path:
+                await route.fulfill(status=200, body="", content_type="text/html")
+                return
+            item = await self._get_local(path)
+            if item is None:
+                await route.abort()
+                return
+        elif url.startswith("http") and request.resource_type in ASSET_RESOURCE_TYPES:
+            item = await self._get_remote(url)
+            if item is None:
+                # 下载失败时交给浏览器自己请求，避免渲染出缺图的图片被缓存
+                await route.continue_()
+                return
+        else:
+            await route.continue_()
+            return
+
+        body, content_type = item
+        await route.fulfill(
+            status=200,
+            body=body,
+            headers={
+                "content-type": content_type,
+                "cache-control": "public, max-age=31536000",
+                "access-control-allow-origin": "*",
+            },
+        )
+
+    @run_sync
+    def clean(self):
+        """
+        说明:
+            清理磁盘上过期的远程资源
+        """
+        time_now = time.time()
+        for file_name in self._disk_path.iterdir():
+            if time_now - file_name.stat().st_mtime > self._max_age:
+                file_name.unlink(missing_ok=True)
+
+    async def close(self):
+        """关闭下载客户端"""
+        await self._client.aclose()
+
+
+class PagePool:
+    """
+    预热页面池，页面已载入模板路径和公共css，渲染时租用，用完归还复用
+    """
+
+    _browser: Browser
+    """Browser实例"""
+    _base_url: str
+    """模板基础路径"""
+    _assets: AssetStore
+    """页面资源仓库"""
+    _size: int
+    """池大小，同时也是同时渲染的页面上限"""
+    _max_renders: int
+    """单个页面最多渲染次数"""
+    _idle: list[Page]
+    """空闲页面"""
+    _renders: dict[Page, int]
+    """页面已渲染次数"""
+    _semaphore: asyncio.Semaphore
+    """租用限制"""
+
+    def __init__(
+        self,
+        browser: Browser,
+        base_url: str,
+        assets: AssetStore,
+        size: int,
+        max_renders: int,
+    ):
+        self._browser = browser
+        self._base_url = base_url
+        self._assets = assets
+        self._size = max(size, 1)
+        self._max_renders = max(max_renders, 1)
+        self._idle = []
+        self._renders = {}
+        self._semaphore = asyncio.Semaphore(self._size)
+
+    async def _new_page(self) -> Page:
+        """
+        说明:
+            新建一个预热页面，打开模板目录并载入公共css，页面资源请求由资源仓库响应
+        """
+        page = await self._browser.new_page(base_url=self._base_url)
+        await page.route("**/*", self._assets.handle)
+        await page.goto(self._base_url)
+        await page.set_content(_WARM_HTML, wait_until="load")
+        self._renders[page] = 0
+        return page
+
+    async def _discard(self, page: Page):
+        """
+        说明:
+            丢弃一个页面
+        """
+        self._renders.pop(page, None)
+        if page.is_closed():
+            return
+        try:
+            await page.close()
+        except Error:
+            pass
+
+    async def warm_up(self):
+        """
+        说明:
+            预先创建页面，填满页面池
+        """
+        while len(self._idle) < self._size:
+            self._idle.append(await self._new_page())
+
+    @asynccontextmanager
+    async def lease(self) -> AsyncIterator[Page]:
+        """
+        说明:
+            租用一个页面，使用上下文管理器，用完自动归还
+
+            归还时已关闭、渲染出错或者达到渲染次数上限的页面会被丢弃，下次租用时重建
+        """
+        async with self._semaphore:
+            page = None
+            while self._idle:
+                one_page = self._idle.pop()
+                if one_page.is_closed():
+                    await self._discard(one_page)
+                    continue
+                page = one_page
+                break
+            if page is None:
+                page = await self._new_page()
+
+            healthy = False
+            try:
+                yield page
+                healthy = True
+            finally:
+                self._renders[page] = self._renders.get(page, 0) + 1
+                if (
+                    healthy
+                    and not page.is_closed()
+                    and self._renders[page] < self._max_renders
+                ):
+                    self._idle.append(page)
+                else:
+                    await self._discard(page)
+
+    async def close(self):
+        """
+        说明:
+            关闭所有空闲页面
+        """
+        while self._idle:
+            await self._discard(self._idle.pop())
+
+
+class BrowserWorker:
+    """
+    渲染worker，每个worker是一个独立的chromium实例和它自己的预热页面池，
+    chromium崩溃断开后自动重启
+    """
+
+    index: int
+    """worker序号"""
+    active: int
+    """正在进行的任务数"""
+    jobs: int
+    """完成的任务数"""
+    restarts: int
+    """重启次数"""
+    _launch: Callable[[], Awaitable[Browser]]
+    """启动chromium的函数"""
+    _base_url: str
+    """模板基础路径"""
+    _assets: AssetStore
+    """页面资源仓库"""
+    _browser: Optional[Browser]
+    """Browser实例，断开后为None"""
+    _pool: Optional[PagePool]
+    """预热页面池，断开后为None"""
+    _restarting: Optional[asyncio.Task]
+    """正在进行的重启任务"""
+    _closed: bool
+    """是否已关闭，关闭后不再重启"""
+
+    def __init__(
+        self,
+        index: int,
+        launch: Callable[[], Awaitable[Browser]],
+        base_url: str,
+        assets: AssetStore,
+    ):
+        self.index = index
+        self.active = 0
+        self.jobs = 0
+        self.restarts = 0
+        self._launch = launch
+        self._base_url = base_url
+        self._assets = assets
+        self._browser = None
+        self._pool = None
+        self._restarting = None
+        self._closed = False
+
+    async def start(self):
+        """
+        说明:
+            启动chromium并预热页面池
+        """
+        browser = await self._launch()
+        browser.on("disconnected", self._on_disconnected)
+        pool = PagePool(
+            browser=browser,
+            base_url=self._base_url,
+            assets=self._assets,
+            size=browser_config.page_pool_size,
+            max_renders=browser_config.page_max_renders,
+        )
+        await pool.warm_up()
+        self._browser = browser
+        self._pool = pool
+
+    def _on_disconnected(self, _):
+        """chromium断开回调，关闭时的断开不处理"""
+        if self._closed:
+            return
+        logger.warning(f"<r>浏览器{self.index}已断开</r>，正在重启...")
+        self._browser = None
+        self._pool = None
+        self._schedule_restart()
+
+    def _schedule_restart(self) -> asyncio.Task:
+        """开始重启，已经在重启时返回正在进行的任务"""
+        if self._restarting is None or self._restarting.done():
+            self._restarting = asyncio.create_task(self._restart())
+        return self._restarting
+
+    async def _restart(self):
+        """
+        说明:
+            重启chromium，失败时等待后重试，等待时间逐渐增加
+        """
+        delay = 1
+        while not self._closed:
+            try:
+                await self.start()
+            except Error as e:
+                logger.error(f"<r>浏览器{self.index}重启失败</r> | {str(e)}")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 60)
+                continue
+            self.restarts += 1
+            logger.info(f"<g>浏览器{self.index}重启成功。</g>")
+            return
+
+    async def _ready(self) -> tuple[Browser, PagePool]:
+        """
+        说明:
+            等待chromium可用，重启完成后如果又断开了会继续等待
+
+        返回:
+            * `tuple[Browser, PagePool]`：当前的Browser实例和页面池
+        """
+        while True:
+            browser, pool = self._browser, self._pool
+            if browser is not None and pool is not None:
+                return browser, pool
+            if self._closed:
+                raise Error(f"浏览器{self.index}已关闭")
+            await asyncio.shield(self._schedule_restart())
+
+    @asynccontextmanager
+    async def lease(self) -> AsyncIterator[Page]:
+        """
+        说明:
+            从页面池租用一个预热页面，使用上下文管理器
+        """
+        self.active += 1
+        try:
+            _, pool = await self._ready()
+            async with pool.lease() as page:
+                yield page
+            self.jobs += 1
+        finally:
+            self.active -= 1
+
+    @asynccontextmanager
+    async def new_page(self, **kwargs) -> AsyncIterator[Page]:
+        """
+        说明:
+            新建一个不在页面池中的页面，使用上下文管理器，用完关闭
+        """
+        self.active += 1
+        try:
+            browser, _ = await self._ready()
+            page = await browser.new_page(**kwargs)
+            try:
+                yield page
+            finally:
+                await page.close()
+            self.jobs += 1
+        finally:
+            self.active -= 1
+
+    async def close(self):
+        """
+        说明:
+            关闭页面池和chromium，不再重启
+        """
+        self._closed = True
+        if self._restarting and not self._restarting.done():
+            self._restarting.cancel()
+        if self._pool:
+            await self._pool.close()
+        if self._browser:
+            try:
+                await self._browser.close()
+            except Error:
+                pass
+
+
+class RenderCache:
+    """
+    模板图片缓存，以模板名、模板修改时间和注入数据计算哈希作为键
+
+    内存中按图片大小做LRU淘汰，可选再缓存一份到磁盘，重启后依然有效
+    """
+
+    _memory: TTLCache
+    """内存缓存"""
+    _disk_path: Optional[Path]
+    """磁盘缓存路径，None为不使用磁盘缓存"""
+
+    def __init__(self, max_bytes: int, disk_path: Optional[Path] = None):
+        self._memory = TTLCache(max_size=max_bytes, sizeof=len)
+        self._disk_path = disk_path
+        if disk_path:
+            disk_path.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def make_key(
+        template_path: Path, pagename: str, kwargs: dict, options: ImageOptions
+    ) -> Optional[str]:
+        """
+        说明:
+            计算缓存键，模板文件或者图片输出设置修改后键会改变
+
+        参数:
+            * `template_path`：模板文件夹
+            * `pagename`：模板文件名
+            * `kwargs`：注入的数据
+            * `options`：图片输出设置
+
+        返回:
+            * `Optional[str]`：缓存键，也是磁盘缓存的文件名，模板不存在时为None
+        """
+        try:
+            mtime = (template_path / pagename).stat().st_mtime_ns
+        except OSError:
+            # 模板不存在时不使用缓存，交给jinja抛出模板错误
+            return None
+        payload = json.dumps(kwargs, sort_keys=True, ensure_ascii=False, default=str)
+        raw = f"{pagename}\n{mtime}\n{tuple(options)}\n{payload}"
+        digest = hashlib.sha256(raw.encode("utf-8")).hexdigest()
+        return f"{digest}.{options.suffix}"
+
+    @run_sync
+    def _load(self, key: str, ttl: int) -> Optional[tuple[bytes, float]]:
+        """
+        说明:
+            从磁盘读取缓存，过期则删除
+
+        返回:
+            * `Optional[tuple[bytes, float]]`：(图片数据, 剩余缓存时间)
+        """
+        file_name = self._disk_path / key
+        try:
+            age = time.time() - file_name.stat().st_mtime
+        except FileNotFoundError:
+            return None
+        if age > ttl:
+            file_name.unlink(missing_ok=True)
+            return None
+        return file_name.read_bytes(), ttl - age
+
+    @run_sync
+    def _save(self, key: str, img: bytes):
+        """
+        说明:
+            写入磁盘缓存
+        """
+        file_name = self._disk_path / key
+        file_name.write_bytes(img)
+
+    @run_sync
+    def clean(self, max_age: int):
+        """
+        说明:
+            清理磁盘上超过时间的缓存文件
+
+        参数:
+            * `max_age`：最长保留时间，秒
+        """
+        if not self._disk_path:
+            return
+        time_now = time.time()
+        for file_name in self._disk_path.iterdir():
+            if file_name.is_file() and time_now - file_name.stat().st_mtime > max_age:
+                file_name.unlink(missing_ok=True)
+
+    async def get(self, key: str, ttl: int) -> Optional[bytes]:
+        """
+        说明:
+            获取缓存图片，先查内存再查磁盘
+
+        参数:
+            * `key`：缓存键
+            * `ttl`：该模板的缓存时间，用于判断磁盘缓存是否过期
+
+        返回:
+            * `Optional[bytes]`：图片数据，未命中为None
+        """
+        img = self._memory.get(key)
+        if img is not None or self._disk_path is None:
+            return img
+        data = await self._load(key, ttl)
+        if data is None:
+            return None
+        img, left_ttl = data
+        self._memory.set(key, img, left_ttl)
+        return img
+
+    async def set(self, key: str, img: bytes, ttl: int):
+        """
+        说明:
+            写入缓存
+
+        参数:
+            * `key`：缓存键
+            * `img`：图片数据
+            * `ttl`：缓存时间，秒
+        """
+        self._memory.set(key, img, ttl)
+        if self._disk_path:
+            await self._save(key, img)
+
 
 class MyBrowser:
     """自定义浏览类"""
 
-    _browser: Optional[Browser] = None
-    """Browser实例"""
+    _workers: list[BrowserWorker] = []
+    """渲染worker，每个是独立的chromium实例"""
     _playwright = None
     """playwright实例"""
     _template_env: jinja2.Environment
     """jinja模板环境"""
     _base_url: str = None
     """模板基础路径"""
+    _assets: Optional[AssetStore] = None
+    """页面资源仓库"""
+    _scheduler: RenderScheduler = RenderScheduler(
+        max_concurrency=browser_config.render_concurrency
+        or max(browser_config.workers, 1) * browser_config.page_pool_size,
+        max_queue=browser_config.render_queue_size,
+        timeout=browser_config.render_timeout,
+    )
+    """渲染调度器"""
+    _render_cache: Optional[RenderCache] = None
+    """模板图片缓存"""
 
     def __new__(cls, *args, **kwargs):
         """单例"""
@@ -36,12 +956,14 @@ class MyBrowser:
         """
         return await self._playwright.chromium.launch(**kwargs)
 
-    async def _get_browser(self, **kwargs) -> Browser:
+    async def _get_worker(self) -> BrowserWorker:
         """
         说明:
-            获取浏览器
+            获取负载最低的worker，负载相同时选择完成任务最少的，未初始化时先初始化
         """
-        return self._browser or await self.init(**kwargs)
+        if not self._workers:
+            await self.init()
+        return min(self._workers, key=lambda worker: (worker.active, worker.jobs))
 
     @asynccontextmanager
     async def _get_new_page(self, **kwargs) -> AsyncIterator[Page]:
@@ -49,12 +971,9 @@ class MyBrowser:
         说明:
             获取新页面，使用上下文管理器
         """
-        browser = await self._get_browser()
-        page = await browser.new_page(**kwargs)
-        try:
+        worker = await self._get_worker()
+        async with worker.new_page(**kwargs) as page:
             yield page
-        finally:
-            await page.close()
 
     async def _install_browser(self):
         """
@@ -72,7 +991,50 @@ class MyBrowser:
         except SystemExit:
             pass
 
-    async def _html_to_pic(self, pagename: str, html: str, wait: int = 0) -> bytes:
+    def _precompile_templates(self):
+        """
+        说明:
+            预先编译所有html模板，首次渲染不再等待编译
+        """
+        time_start = time.monotonic()
+        names = self._template_env.list_templates(extensions=["html"])
+        for name in names:
+            try:
+                self._template_env.get_template(name)
+            except jinja2.TemplateError as e:
+                logger.error(f"<r>模板编译失败</r> | {name} | {str(e)}")
+        cost = time.monotonic() - time_start
+        logger.debug(f"模板预编译完成 | {len(names)}个模板 | 用时{cost:.2f}秒")
+
+    async def _screenshot(
+        self, target: Union[Page, ElementHandle], options: ImageOptions, **kwargs
+    ) -> bytes:
+        """
+        说明:
+            按输出设置截图，需要转webp或缩放时先截取无损png再用Pillow处理
+
+        参数:
+            * `target`：截图的页面或元素
+            * `options`：图片输出设置
+            * `**kwargs`：其他截图参数
+
+        返回:
+            * `bytes`：图片数据
+        """
+        if Image is not None and _need_pillow(options):
+            raw = await target.screenshot(type="png", **kwargs)
+            return await _encode_image(raw, options)
+        if options.format == "png":
+            return await target.screenshot(type="png", **kwargs)
+        return await target.screenshot(type="jpeg", quality=options.quality, **kwargs)
+
+    async def _html_to_pic(
+        self,
+        pagename: str,
+        html: str,
+        wait: int = 0,
+        options: Optional[ImageOptions] = None,
+    ) -> bytes:
         """
         说明:
             html转图片
@@ -81,18 +1043,21 @@ class MyBrowser:
             * `pagename`: 页面名称，template下的文件名
             * `html`: html的输出文本
             * `wait`: 等待时间，对于有动画需求的，默认为0。
+            * `options`: 图片输出设置，默认使用该模板的设置
 
         返回:
             * bytes: 图片bytes, 可直接发送
         """
-        async with self._get_new_page(base_url=self._base_url) as page:
-            await page.goto(pagename)
-            await page.set_content(html, wait_until="networkidle")
+        worker = await self._get_worker()
+        options = options or get_image_options(pagename)
+        async with worker.lease() as page:
+            # 资源都由本地响应，不需要等待网络空闲
+            await page.set_content(html, wait_until="load")
             await page.wait_for_timeout(wait)
 
             # 选择标签main，这里是为了获得更好的图片，所以每个页面都需要有一个main标签
             element_handle = await page.query_selector("#main")
-            img_raw = await element_handle.screenshot(type="jpeg", quality=100)
+            img_raw = await self._screenshot(element_handle, options)
         return img_raw
 
     async def _template_to_html(
@@ -116,38 +1081,76 @@ class MyBrowser:
 
         return await template.render_async(**kwargs)
 
-    async def init(self) -> Browser:
+    async def init(self):
         """
         说明:
             初始化playwright，需要在启动时使用
         """
         template_path = path_config.templates
-        path = Path(template_path).absolute()
-        self._base_url = f"file://{path}/"
+        self._base_url = TEMPLATE_ORIGIN
         self._playwright = await async_playwright().start()
+        # 编译好的模板字节码缓存在data目录，重启后不用重新编译，模板文件修改后自动重载
+        bytecode_path = Path(path_config.data) / "jinja_cache"
+        bytecode_path.mkdir(parents=True, exist_ok=True)
         self._template_env = jinja2.Environment(
             loader=jinja2.FileSystemLoader(template_path),
+            bytecode_cache=jinja2.FileSystemBytecodeCache(str(bytecode_path)),
+            auto_reload=True,
+            cache_size=-1,
             enable_async=True,
         )
+        self._precompile_templates()
+        disk_path = None
+        if browser_config.render_cache_disk:
+            disk_path = Path(path_config.data) / "render_cache"
+        self._render_cache = RenderCache(
+            max_bytes=browser_config.render_cache_size * 1024 * 1024,
+            disk_path=disk_path,
+        )
+        max_age = max([browser_config.render_cache_ttl, *RENDER_CACHE_TTL.values()])
+        await self._render_cache.clean(max_age)
+        self._assets = AssetStore(
+            template_path=Path(template_path),
+            disk_path=Path(path_config.data) / "asset_cache",
+            max_bytes=browser_config.asset_cache_size * 1024 * 1024,
+            max_age=browser_config.asset_cache_days * 86400,
+        )
+        await self._assets.clean()
+        workers = [
+            BrowserWorker(
+                index=index,
+                launch=self._launch_browser,
+                base_url=self._base_url,
+                assets=self._assets,
+            )
+            for index in range(max(browser_config.workers, 1))
+        ]
         try:
-            self._browser = await self._launch_browser()
+            await workers[0].start()
         except Error:
             await self._install_browser()
-            self._browser = await self._launch_browser()
-        return self._browser
+            await workers[0].start()
+        await asyncio.gather(*(worker.start() for worker in workers[1:]))
+        self._workers = workers
+        if Image is None and _need_pillow(get_image_options()):
+            logger.warning("未安装Pillow，无法输出webp和缩放图片，将使用浏览器直接输出jpeg")
 
     async def shutdown(self):
         """
         说明:
             关闭浏览器，在shutdown时使用
         """
-        await self._browser.close()
+        for worker in self._workers:
+            await worker.close()
+        if self._assets:
+            await self._assets.close()
         await self._playwright.stop()
 
     async def template_to_image(self, pagename: str, **kwargs) -> bytes:
         """
         说明:
-            将模板页面转化成图片
+            将模板页面转化成图片，相同模板和数据在缓存时间内直接返回缓存图片，
+            截图由渲染调度器排队执行
 
         参数:
             * `pagename`：模板文件名
@@ -155,10 +1158,54 @@ class MyBrowser:
 
         返回:
             * `bytes`：图片数据
+
+        异常:
+            * `RenderError`：渲染队列已满或者渲染超时
         """
+        if not self._workers:
+            await self.init()
+        ttl = RENDER_CACHE_TTL.get(pagename, browser_config.render_cache_ttl)
+        key = None
+        if ttl > 0:
+            template_path = Path(path_config.templates)
+            options = get_image_options(pagename)
+            key = RenderCache.make_key(template_path, pagename, kwargs, options)
+        if key is not None:
+            img = await self._render_cache.get(key, ttl)
+            if img is not None:
+                logger.debug(f"<g>模板缓存命中</g> | {pagename}")
+                return img
 
         html = await self._template_to_html(template_name=pagename, **kwargs)
-        return await self._html_to_pic(pagename, html)
+        img = await self._scheduler.run(lambda: self._html_to_pic(pagename, html))
+        if key is not None:
+            await self._render_cache.set(key, img, ttl)
+        return img
+
+    async def render_template(
+        self, pagename: str, data: dict, options: ImageOptions
+    ) -> bytes:
+        """
+        说明:
+            不使用缓存，按指定的图片输出设置渲染模板，用于对比不同设置的基准测试
+
+        参数:
+            * `pagename`：模板文件名
+            * `data`：注入的数据
+            * `options`：图片输出设置
+
+        返回:
+            * `bytes`：图片数据
+
+        异常:
+            * `RenderError`：渲染队列已满或者渲染超时
+        """
+        if not self._workers:
+            await self.init()
+        html = await self._template_to_html(template_name=pagename, **data)
+        return await self._scheduler.run(
+            lambda: self._html_to_pic(pagename, html, options=options)
+        )
 
     async def get_image_from_url(self, url: str, width: int, height: int) -> bytes:
         """
@@ -172,15 +1219,38 @@ class MyBrowser:
 
         返回:
             * `bytes`：图片数据
+
+        异常:
+            * `RenderError`：渲染队列已满或者渲染超时
+        """
+        return await self._scheduler.run(lambda: self._url_to_pic(url, width, height))
+
+    async def _url_to_pic(self, url: str, width: int, height: int) -> bytes:
+        """
+        说明:
+            打开url并截取整个页面
         """
         async with self._get_new_page() as page:
             viewport_size = {"width": width, "height": height}
             await page.set_viewport_size(viewport_size)
             await page.goto(url)
             await page.wait_for_load_state("networkidle")
-            img = await page.screenshot(type="jpeg", quality=100, full_page=True)
+            img = await self._screenshot(page, get_image_options(), full_page=True)
         return img
 
+    def get_stats(self) -> dict[str, float]:
+        """
+        说明:
+            获取渲染调度统计，参考`RenderScheduler.get_stats()`，另外包含：
+                * `workers`：worker数量
+                * `restarts`：worker累计重启次数
+        """
+        return {
+            **self._scheduler.get_stats(),
+            "workers": len(self._workers),
+            "restarts": sum(worker.restarts for worker in self._workers),
+        }
+
 
 browser = MyBrowser()
 """
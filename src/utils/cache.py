@@ -0,0 +1,101 @@
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+
+class TTLCache:
+    """
+    带过期时间的LRU缓存，超过容量时淘汰最久未使用的数据，使用方法：
+    ```
+    cache = TTLCache(max_size=128)
+
+    >>>cache.set(key, value, ttl=60) # 缓存60秒
+    >>>cache.get(key) # 过期或未命中返回None
+    ```
+    """
+
+    _data: OrderedDict[Hashable, tuple[Any, float]]
+    """缓存数据，值为(数据, 过期时间)"""
+    _max_size: int
+    """最大容量"""
+    _sizeof: Callable[[Any], int]
+    """计算单个数据占用容量的函数"""
+    _size: int
+    """当前占用容量"""
+
+    def __init__(self, max_size: int, sizeof: Optional[Callable[[Any], int]] = None):
+        """
+        参数:
+            * `max_size`：最大容量，默认按条数计算
+            * `sizeof`：可选，计算单个数据的占用容量，比如按字节数计算
+        """
+        self._data = OrderedDict()
+        self._max_size = max_size
+        self._sizeof = sizeof or (lambda _: 1)
+        self._size = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get_entry(self, key: Hashable) -> Optional[tuple[Any, float]]:
+        """
+        说明:
+            获取缓存数据及其过期时间，不判断是否过期
+
+        返回:
+            * `Optional[tuple[Any, float]]`：(数据, 过期时间戳)，未命中为None
+        """
+        entry = self._data.get(key)
+        if entry is not None:
+            self._data.move_to_end(key)
+        return entry
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """
+        说明:
+            获取缓存数据，过期或未命中返回None
+        """
+        entry = self.get_entry(key)
+        if entry is None:
+            return None
+        value, expire_at = entry
+        if expire_at < time.monotonic():
+            self.pop(key)
+            return None
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: float):
+        """
+        说明:
+            写入缓存，超出容量时淘汰最久未使用的数据
+
+        参数:
+            * `key`：键
+            * `value`：数据
+            * `ttl`：过期时间，秒
+        """
+        self.pop(key)
+        size = self._sizeof(value)
+        if size > self._max_size:
+            return
+        self._data[key] = (value, time.monotonic() + ttl)
+        self._size += size
+        while self._size > self._max_size:
+            old_key = next(iter(self._data))
+            self.pop(old_key)
+
+    def pop(self, key: Hashable) -> Optional[Any]:
+        """
+        说明:
+            删除一条缓存，返回被删除的数据
+        """
+        entry = self._data.pop(key, None)
+        if entry is None:
+            return None
+        self._size -= self._sizeof(entry[0])
+        return entry[0]
+
+    def clear(self):
+        """清空缓存"""
+        self._data.clear()
+        self._size = 0
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+模板渲染基准测试，对比不同图片格式和质量下每个模板的图片大小和耗时，
+用于选择`browser_image_*`的配置，在项目根目录运行：
+
+    python tools/benchmark_render.py
+    python tools/benchmark_render.py --rounds 10 --max-width 800
+"""
+
+import argparse
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import nonebot  # noqa: E402
+
+nonebot.init()
+
+from src.utils.browser import ImageOptions, browser  # noqa: E402
+
+try:
+    import PIL
+except ImportError:
+    PIL = None
+
+SAMPLE_ROWS = 50
+"""列表模板的样例行数"""
+
+SAMPLES: dict[str, dict] = {
+    "查询帮助.html": {"flag": True},
+    "管理员帮助.html": {},
+    "超级用户帮助.html": {},
+    "好友列表.html": {
+        "num": SAMPLE_ROWS,
+        "page": 1,
+        "pages": 1,
+        "user_list": [
+            {"user_id": 10000 + i, "nickname": f"好友{i}", "remark": f"备注{i}"}
+            for i in range(SAMPLE_ROWS)
+        ],
+    },
+    "群列表.html": {
+        "num": SAMPLE_ROWS,
+        "page": 1,
+        "pages": 1,
+        "group_list": [
+            {
+                "group_id": 100000 + i,
+                "group_name": f"测试群{i}",
+                "server": "幽月轮",
+                "sign_nums": i,
+                "robot_status": i % 2 == 0,
+                "robot_active": 10,
+            }
+            for i in range(SAMPLE_ROWS)
+        ],
+    },
+}
+"""测试的模板和注入数据"""
+
+
+async def benchmark(
+    rounds: int, formats: list[str], qualities: list[int], max_width: int
+):
+    await browser.init()
+    print(f"{'模板':<12}{'格式':<6}{'质量':>6}{'大小(KB)':>12}{'耗时(ms)':>12}")
+    for pagename, kwargs in SAMPLES.items():
+        for image_format in formats:
+            for quality in qualities if image_format != "png" else [0]:
+                prefix = f"{pagename:<12}{image_format:<6}{quality:>6}"
+                if PIL is None and (image_format == "webp" or max_width > 0):
+                    # 没有Pillow时webp会输出为jpeg，也不能缩放，结果没有意义
+                    print(f"{prefix}{'未安装Pillow，跳过':>24}")
+                    continue
+                options = ImageOptions(image_format, quality, max_width)
+                size = 0
+                time_start = time.perf_counter()
+                for _ in range(rounds):
+                    img = await browser.render_template(pagename, kwargs, options)
+                    size = len(img)
+                cost = (time.perf_counter() - time_start) * 1000 / rounds
+                print(f"{prefix}{size / 1024:>12.1f}{cost:>12.1f}")
+    await browser.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="模板渲染基准测试")
+    parser.add_argument("--rounds", type=int, default=5, help="每种设置渲染次数")
+    parser.add_argument(
+        "--formats", nargs="+", default=["jpeg", "png", "webp"], help="测试的图片格式"
+    )
+    parser.add_argument(
+        "--qualities", nargs="+", type=int, default=[100, 85, 70], help="测试的图片质量"
+    )
+    parser.add_argument("--max-width", type=int, default=0, help="图片最大宽度，0为不限制")
+    args = parser.parse_args()
+    asyncio.run(benchmark(args.rounds, args.formats, args.qualities, args.max_width))
+
+
+if __name__ == "__main__":
+    main()
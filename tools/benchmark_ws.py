@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ws消息解码基准测试，对比原来的解码流程（json + WsData + parse_obj，时间戳每条都转换）和
+现在的解码流程（orjson + 事件构造表 + 时间戳缓存），输出每秒解码的消息数，在项目根目录运行：
+
+    python tools/benchmark_ws.py
+    python tools/benchmark_ws.py --corpus frames.txt --rounds 20
+
+`--corpus`为抓取的ws原始消息文件，每行一条；不指定时使用内置的1001-1008、2001/2002样例消息。
+"""
+
+import argparse
+import json
+import random
+import sys
+import time
+from pathlib import Path
+from typing import Callable
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import nonebot  # noqa: E402
+
+nonebot.init()
+
+from pydantic import BaseModel  # noqa: E402
+
+from src.managers.server_manager import _jx3_event  # noqa: E402
+from src.managers.server_manager._jx3_event import (  # noqa: E402
+    EventRister,
+    format_timestamp,
+)
+from src.managers.server_manager.ingest import json_loads, orjson  # noqa: E402
+
+SAMPLE_SIZE = 10000
+"""内置样例的消息数"""
+
+SERVERS = ["幽月轮", "斗转星移", "绝代天骄", "梦江南", "唯我独尊", "长安城"]
+"""样例服务器"""
+
+SAMPLE_DATA: dict[int, dict] = {
+    1001: {"name": "侠士", "serendipity": "阴阳两界", "level": 1, "time": 0},
+    1002: {"map": "阴山大草原", "min": 5, "max": 10, "time": 0},
+    1003: {"name": "侠士", "map": "鲲鹏岛", "horse": "赤兔", "time": 0},
+    1004: {"time": 0},
+    1005: {"names": ["侠士", "大侠"], "time": 0},
+    1006: {
+        "role": "广陵邑",
+        "name": "侠士",
+        "sender": "大侠",
+        "recipient": "一往情深",
+        "time": 0,
+    },
+    1007: {"role": "侠士", "map": "河西瀚漠", "name": "天乙玄晶", "time": 0},
+    1008: {"message": "侠士击败了首领", "time": 0},
+    2001: {"status": 1},
+    2002: {
+        "type": "公告",
+        "title": "测试新闻",
+        "url": "https://jx3.xoyo.com",
+        "date": "10-18",
+    },
+}
+"""各类型的样例消息数据，server和time生成时填入"""
+
+
+def make_data(action: int, index: int, timestamp: int) -> dict:
+    """生成一条样例消息数据"""
+    data = dict(SAMPLE_DATA[action])
+    data["server"] = SERVERS[index % len(SERVERS)]
+    if "time" in data:
+        data["time"] = timestamp
+    return data
+
+
+def make_corpus() -> list[str]:
+    """生成内置样例，奇遇和烟花最多，多条消息落在同一秒"""
+    actions = [1001] * 40 + [1006] * 25 + [1007] * 10 + [1008] * 10
+    actions += [1002, 1003, 1004, 1005] * 3 + [2001, 2002] * 2
+    start = int(time.time())
+    frames = []
+    for index in range(SAMPLE_SIZE):
+        action = random.choice(actions)
+        data = make_data(action, index, start + index // 5)
+        frames.append(json.dumps({"action": action, "data": data}, ensure_ascii=False))
+    return frames
+
+
+class WsData(BaseModel):
+    """原来的ws数据模型，每条消息先经过它校验"""
+
+    action: int
+    data: dict
+
+
+def legacy_decode(message: str):
+    """原来的解码流程"""
+    ws_obj = json.loads(message)
+    data = WsData.parse_obj(ws_obj)
+    event = EventRister.event_dict.get(data.action)
+    if event:
+        return event.parse_obj(data.data)
+    return None
+
+
+def fast_decode(message: str):
+    """现在的解码流程"""
+    ws_obj = json_loads(message)
+    return EventRister.build_event(int(ws_obj["action"]), ws_obj.get("data") or {})
+
+
+def run(name: str, decode: Callable, frames: list[str], rounds: int, cached: bool):
+    """
+    解码全部消息并输出结果，`cached`为False时时间戳每条都重新转换，和原来的校验器一致
+    """
+    format_timestamp.cache_clear()
+    # 校验器调用时才查找模块里的format_timestamp，替换掉即可去掉缓存
+    _jx3_event.format_timestamp = (
+        format_timestamp if cached else format_timestamp.__wrapped__
+    )
+    failed = 0
+    time_start = time.perf_counter()
+    for _ in range(rounds):
+        for message in frames:
+            try:
+                decode(message)
+            except Exception:
+                failed += 1
+    cost = time.perf_counter() - time_start
+    _jx3_event.format_timestamp = format_timestamp
+    total = len(frames) * rounds
+    print(f"{name:<10}{total / cost:>14.0f}{cost * 1e6 / total:>12.1f}{failed:>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ws消息解码基准测试")
+    parser.add_argument("--corpus", type=Path, help="ws原始消息文件，每行一条")
+    parser.add_argument("--rounds", type=int, default=5, help="重复次数")
+    args = parser.parse_args()
+
+    if args.corpus:
+        frames = [line for line in args.corpus.read_text("utf-8").splitlines() if line]
+    else:
+        frames = make_corpus()
+    print(f"消息 {len(frames)} 条，重复 {args.rounds} 次，orjson：{'有' if orjson else '无'}")
+    print(f"{'流程':<10}{'消息/秒':>14}{'微秒/条':>12}{'失败':>8}")
+    run("原流程", legacy_decode, frames, args.rounds, cached=False)
+    run("新流程", fast_decode, frames, args.rounds, cached=True)
+
+
+if __name__ == "__main__":
+    main()